@@ -1,4 +1,5 @@
 import os
+import sys
 
 from dotenv import load_dotenv
 from logging.config import fileConfig
@@ -8,7 +9,12 @@ from sqlalchemy import pool
 
 from alembic import context
 
-from src.user.models import Base
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from user.models import Base  # noqa: E402
+from user.ext.models.model import Base as MultiRoleBase  # noqa: E402
+import auth.models  # noqa: E402,F401
+import audit.models  # noqa: E402,F401
 
 load_dotenv()
 database_url = os.getenv("DATABASE_URL")
@@ -20,7 +26,7 @@ config.set_main_option("sqlalchemy.url", database_url)
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
-target_metadata = Base.metadata
+target_metadata = [Base.metadata, MultiRoleBase.metadata]
 
 
 # other values from the config, defined by the needs of env.py,
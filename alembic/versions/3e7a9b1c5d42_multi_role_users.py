@@ -0,0 +1,48 @@
+"""multi-role users
+
+Revision ID: 3e7a9b1c5d42
+Revises: 8c4d2e6f1a37
+Create Date: 2026-10-18 19:05:47.302114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e7a9b1c5d42'
+down_revision: Union[str, None] = '8c4d2e6f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Bit 1 << role of user.schemas.UserRole, the predicates must stay identical to user.ext.models.model.has_role
+SUPERADMIN_PREDICATE = sa.text('(roles & 1) != 0')
+ADMIN_PREDICATE = sa.text('(roles & 2) != 0')
+
+
+def upgrade() -> None:
+    op.create_table('users',
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('surname', sa.String(), nullable=True),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('hashed_password', sa.String(), nullable=False),
+    sa.Column('roles', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_index('ix_users_role_superadmin_user_id', 'users', ['user_id'], unique=False,
+                    postgresql_where=SUPERADMIN_PREDICATE, sqlite_where=SUPERADMIN_PREDICATE)
+    op.create_index('ix_users_role_admin_user_id', 'users', ['user_id'], unique=False,
+                    postgresql_where=ADMIN_PREDICATE, sqlite_where=ADMIN_PREDICATE)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_role_admin_user_id', table_name='users')
+    op.drop_index('ix_users_role_superadmin_user_id', table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,30 @@
+"""user listing indexes
+
+Revision ID: 8c4d2e6f1a37
+Revises: 5b1f3c7a9d21
+Create Date: 2026-10-18 12:41:05.118024
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4d2e6f1a37'
+down_revision: Union[str, None] = '5b1f3c7a9d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_user_role_user_id', 'user', ['role', 'user_id'], unique=False,
+                    postgresql_include=['username', 'email', 'is_active'])
+    op.create_index('ix_user_is_active_user_id', 'user', ['is_active', 'user_id'], unique=False,
+                    postgresql_include=['username', 'email', 'role'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_is_active_user_id', table_name='user')
+    op.drop_index('ix_user_role_user_id', table_name='user')
@@ -0,0 +1,30 @@
+"""login email index
+
+Revision ID: a4c8e2f61b93
+Revises: 3e7a9b1c5d42
+Create Date: 2026-10-18 20:12:36.540871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c8e2f61b93'
+down_revision: Union[str, None] = '3e7a9b1c5d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The conditions must stay identical to what user.dals renders for `User.is_active == True`
+    op.create_index('ix_user_active_lower_email', 'user', [sa.text('lower(email)')], unique=False,
+                    postgresql_include=['user_id', 'username', 'email', 'is_active', 'role', 'hashed_password'],
+                    postgresql_where=sa.text('is_active = true'),
+                    sqlite_where=sa.text('is_active = 1'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_active_lower_email', table_name='user')
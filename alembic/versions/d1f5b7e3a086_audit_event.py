@@ -0,0 +1,39 @@
+"""audit event
+
+Revision ID: d1f5b7e3a086
+Revises: a4c8e2f61b93
+Create Date: 2026-10-18 21:03:18.774520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1f5b7e3a086'
+down_revision: Union[str, None] = 'a4c8e2f61b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('audit_event',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('occurred_at', sa.Float(), nullable=False),
+    sa.Column('event', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('account', sa.String(), nullable=True),
+    sa.Column('ip', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_event_occurred_at_id', 'audit_event', ['occurred_at', 'id'], unique=False)
+    op.create_index('ix_audit_event_user_id_occurred_at_id', 'audit_event', ['user_id', 'occurred_at', 'id'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_audit_event_user_id_occurred_at_id', table_name='audit_event')
+    op.drop_index('ix_audit_event_occurred_at_id', table_name='audit_event')
+    op.drop_table('audit_event')
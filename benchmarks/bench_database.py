@@ -0,0 +1,36 @@
+"""
+Database of the benchmarks that create, drop or reseed tables.
+They never run against ASYNC_DATABASE_URL, the service's database: by default they use a SQLite file
+in the temp directory, BENCH_DATABASE_URL opts into another throwaway database (e.g. a local Postgres).
+"""
+import os
+import tempfile
+from typing import Optional
+
+import settings
+
+# Set by the first call, later calls return its SQLite path
+_selected = False
+_selected_path: Optional[str] = None
+
+
+def use_bench_database(file_name: str) -> Optional[str]:
+    """
+    Point the settings at the benchmark database, call it before `session` is imported.
+    Returns the path of the temporary SQLite file to remove after the run, None with BENCH_DATABASE_URL.
+    Later calls keep the database of the first one, e.g. the one tests/conftest.py picks for the test run.
+    """
+    global _selected, _selected_path
+    if _selected:
+        return _selected_path
+    url = os.environ.get("BENCH_DATABASE_URL")
+    path = None
+    if not url:
+        path = os.path.join(tempfile.gettempdir(), file_name)
+        url = f"sqlite+aiosqlite:///{path}"
+    if url == settings.ASYNC_DATABASE_URL or url in settings.ASYNC_DATABASE_REPLICA_URLS:
+        raise SystemExit("BENCH_DATABASE_URL is a database of the service, the benchmark would overwrite its data")
+    settings.ASYNC_DATABASE_URL = url
+    settings.ASYNC_DATABASE_REPLICA_URLS = []
+    _selected, _selected_path = True, path
+    return path
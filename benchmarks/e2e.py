@@ -0,0 +1,224 @@
+"""
+End-to-end latency and throughput of the auth and user endpoints.
+The app runs in-process behind httpx's ASGI transport, with its lifespan, against a temporary SQLite file
+or the throwaway database in BENCH_DATABASE_URL (e.g. a local Postgres with migrations applied).
+
+    python benchmarks/e2e.py --users 1000 --requests 200 --concurrency 1 8 32 --output run.json
+    python benchmarks/e2e.py --baseline run.json --max-regression 0.2
+
+Login rate limits are disabled so the benchmark measures the request path, not the limiter.
+Login and user creation run bcrypt and dominate the total run time.
+With --baseline, the run exits with 1 if any p95 latency or throughput is more than --max-regression worse.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import uuid
+
+os.environ.setdefault("AUTH_LOGIN_IP_LIMIT", "0")
+os.environ.setdefault("AUTH_LOGIN_ACCOUNT_LIMIT", "0")
+os.environ.setdefault("AUTH_LOGIN_MAX_WAITING", "100000")
+os.environ.setdefault("AUTH_LOGIN_WAIT_TIMEOUT_SECONDS", "600")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from bench_database import use_bench_database  # noqa: E402
+
+DB_PATH = use_bench_database("auth_service_e2e_bench.sqlite")
+
+import httpx  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+import auth.models  # noqa: E402,F401
+from auth import Hasher  # noqa: E402
+from auth.utils.hashing import configure_password_context, get_password_context_options  # noqa: E402
+from auth.services import create_pair_of_tokens  # noqa: E402
+from main import app  # noqa: E402
+from session import engine  # noqa: E402
+from user.models import Base, User  # noqa: E402
+from user.schemas import UserDTO  # noqa: E402
+
+PASSWORD = "benchmark-password"
+SEED_CHUNK = 5000
+ENDPOINTS = ("login", "refresh", "protected", "create_user")
+
+
+async def seed(users: int):
+    """Replace the bench users, all sharing one password hash so seeding skips bcrypt"""
+    # Seed at the cost the app will calibrate to, or every login would also rehash
+    configure_password_context(get_password_context_options())
+    hashed_password = Hasher.get_password_hash(PASSWORD)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(delete(User).where(User.email.like("%@bench.example.com")))
+        for start in range(0, users, SEED_CHUNK):
+            await connection.execute(insert(User), [
+                {"username": f"bench{i}", "email": f"bench{i}@bench.example.com", "is_active": True,
+                 "hashed_password": hashed_password, "role": 2}
+                for i in range(start, min(start + SEED_CHUNK, users))
+            ])
+        res = await connection.execute(
+            select(User.user_id, User.username, User.email, User.is_active, User.role, User.hashed_password)
+            .where(User.email.like("%@bench.example.com"))
+        )
+        return [UserDTO.model_construct(**row._mapping) for row in res.fetchall()]
+
+
+def build_requests(endpoint: str, users: list, count: int) -> list:
+    """Arguments of client.request for every call, prepared up front so token signing stays out of the timings"""
+    if endpoint == "login":
+        return [
+            ("POST", "/auth/login", {"data": {"username": users[i % len(users)].email, "password": PASSWORD}})
+            for i in range(count)
+        ]
+    if endpoint == "refresh":
+        # A refresh token is single-use, every call gets one of its own
+        return [
+            ("POST", "/auth/refresh", {"json": {"refresh_token": create_pair_of_tokens(users[i % len(users)])[0]}})
+            for i in range(count)
+        ]
+    if endpoint == "protected":
+        access_tokens = [create_pair_of_tokens(user)[1] for user in users[:count]]
+        return [
+            ("GET", "/auth/protected-route",
+             {"headers": {"Authorization": f"Bearer {access_tokens[i % len(access_tokens)]}"}})
+            for i in range(count)
+        ]
+    run_id = uuid.uuid4().hex[:8]
+    return [
+        ("POST", "/user/", {"json": {"username": f"new{run_id}{i}", "email": f"new{run_id}{i}@bench.example.com",
+                                     "password": PASSWORD}})
+        for i in range(count)
+    ]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile"""
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+async def run_level(client: httpx.AsyncClient, requests: list, concurrency: int) -> dict:
+    latencies = []
+    statuses = {}
+    pending = iter(requests)
+
+    async def worker():
+        for method, url, kwargs in pending:
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list, baseline: dict, max_regression: float) -> list:
+    """Human-readable regressions of results against a previous run"""
+    previous = {(item["endpoint"], item["concurrency"]): item for item in baseline["results"]}
+    regressions = []
+    for item in results:
+        before = previous.get((item["endpoint"], item["concurrency"]))
+        if before is None:
+            continue
+        key = f"{item['endpoint']} x{item['concurrency']}"
+        p95_change = item["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1
+        throughput_change = 1 - item["throughput_rps"] / before["throughput_rps"]
+        if p95_change > max_regression:
+            regressions.append(f"{key}: p95 {before['latency_ms']['p95']} -> {item['latency_ms']['p95']} ms")
+        if throughput_change > max_regression:
+            regressions.append(f"{key}: throughput {before['throughput_rps']} -> {item['throughput_rps']} rps")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    users = await seed(args.users)
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 50000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    # Tokens and new users are single-use, the warm-up round gets its own
+                    requests = build_requests(endpoint, users, concurrency + args.requests)
+                    await run_level(client, requests[:concurrency], concurrency)
+                    result = await run_level(client, requests[concurrency:], concurrency)
+                    results.append({"endpoint": endpoint, "concurrency": concurrency, **result})
+                    print(f"{endpoint:<12} x{concurrency:<4} {result['throughput_rps']:>9.1f} rps  "
+                          f"p50 {result['latency_ms']['p50']:>9.2f}  p95 {result['latency_ms']['p95']:>9.2f}  "
+                          f"p99 {result['latency_ms']['p99']:>9.2f} ms  errors {result['errors']}", file=sys.stderr)
+    await engine.dispose()
+    if DB_PATH is not None and os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": engine.dialect.name,
+            "users": args.users,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
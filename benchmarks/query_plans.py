@@ -0,0 +1,151 @@
+"""
+Query plan check of the DAL queries: every statement a DAL call sends is run through EXPLAIN,
+the check fails if any of them reads a table with a full scan instead of an index.
+Seeds a temporary SQLite file, or the throwaway database in BENCH_DATABASE_URL (e.g. a local Postgres).
+tests/test_query_plans.py runs the same checks under pytest.
+
+    python benchmarks/query_plans.py --users 5000
+
+On Postgres sequential scans are disabled for the check: on a small table the planner rightly prefers
+them, the check asks whether an index can serve the query at all. Exits with 1 on a full scan.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from bench_database import use_bench_database  # noqa: E402
+
+DB_PATH = use_bench_database("auth_service_query_plans.sqlite")
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+import auth.models  # noqa: E402,F401
+from audit.dals import AuditEventDAL  # noqa: E402
+from session import async_session, engine  # noqa: E402
+from user.dals import SQLAlchemyUserDAL  # noqa: E402
+from user.ext.dals import MultiRoleUserDAL  # noqa: E402
+from user.ext.models.model import Base as MultiRoleBase  # noqa: E402
+from user.ext.models.model import User as MultiRoleUser  # noqa: E402
+from user.ext.models.model import roles_to_bits  # noqa: E402
+from user.models import Base, User  # noqa: E402
+from user.schemas import UserRole  # noqa: E402
+
+# DAL calls with arguments hitting existing rows, so every statement of the call is sent
+CHECKS = {
+    "get_user_by_id": lambda session: SQLAlchemyUserDAL(session, cache=None).get_user_by_id(42),
+    "get_user_by_email": lambda session: SQLAlchemyUserDAL(session, cache=None).get_user_by_email("user42@example.com"),
+    "get_active_user_by_email": (
+        lambda session: SQLAlchemyUserDAL(session, cache=None).get_active_user_by_email("User42@Example.com")
+    ),
+    "get_user_by_username": lambda session: SQLAlchemyUserDAL(session, cache=None).get_user_by_username("user42"),
+    "get_users_by_ids": lambda session: SQLAlchemyUserDAL(session, cache=None).get_users_by_ids([1, 2, 3]),
+    "get_users_by_emails": (
+        lambda session: SQLAlchemyUserDAL(session, cache=None).get_users_by_emails(["user1@example.com"])
+    ),
+    "get_users_by_usernames": lambda session: SQLAlchemyUserDAL(session, cache=None).get_users_by_usernames(["user1"]),
+    "list_users after": lambda session: SQLAlchemyUserDAL(session, cache=None).list_users(50, after_user_id=100),
+    "list_users role": lambda session: SQLAlchemyUserDAL(session, cache=None).list_users(50, role=UserRole.ROLE_ADMIN),
+    "update_user": lambda session: SQLAlchemyUserDAL(session, cache=None).update_user(42, username="renamed42"),
+    "update_password_hash": (
+        lambda session: SQLAlchemyUserDAL(session, cache=None).update_password_hash(42, "x" * 60, "y" * 60)
+    ),
+    "delete_user": lambda session: SQLAlchemyUserDAL(session, cache=None).delete_user(42),
+    "audit list_events": lambda session: AuditEventDAL(session).list_events(50, since=0, until=2e9),
+    "audit list_events user": lambda session: AuditEventDAL(session).list_events(50, user_id=42),
+    "multi-role list_users_with_roles": (
+        lambda session: MultiRoleUserDAL(session).list_users_with_roles([UserRole.ROLE_ADMIN], 50)
+    ),
+}
+
+
+async def seed(users: int):
+    """Mostly regular users, one in 100 an admin: the shape partial indexes are meant for"""
+    async with engine.begin() as connection:
+        for metadata in (Base.metadata, MultiRoleBase.metadata):
+            await connection.run_sync(metadata.drop_all)
+            await connection.run_sync(metadata.create_all)
+        await connection.execute(insert(User), [
+            {"username": f"user{i}", "email": f"user{i}@example.com", "is_active": i % 10 != 0,
+             "hashed_password": "x" * 60, "role": UserRole.ROLE_ADMIN if i % 100 == 0 else UserRole.ROLE_USER}
+            for i in range(users)
+        ])
+        await connection.execute(insert(MultiRoleUser), [
+            {"user_id": uuid.uuid4(), "username": f"user{i}", "email": f"user{i}@example.com",
+             "hashed_password": "x" * 60,
+             "roles": roles_to_bits([UserRole.ROLE_USER, UserRole.ROLE_ADMIN] if i % 100 == 0
+                                    else [UserRole.ROLE_USER])}
+            for i in range(users)
+        ])
+        await connection.execute(text("ANALYZE"))
+
+
+async def capture_statements(check) -> list:
+    """Statements and parameters sent by one DAL call, its writes are rolled back"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        async with async_session() as session:
+            async with session.begin():
+                await check(session)
+                await session.rollback()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+async def explain(statement: str, parameters) -> list:
+    async with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            await connection.exec_driver_sql("SET enable_seqscan = off")
+            res = await connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            return [row[0] for row in res.fetchall()]
+        res = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in res.fetchall()]
+
+
+def is_full_scan(plan_line: str) -> bool:
+    if engine.dialect.name == "postgresql":
+        return "Seq Scan" in plan_line
+    # SQLite: "SCAN user" reads the whole table, "SCAN user USING INDEX ..." walks an index in order
+    return plan_line.lstrip().startswith("SCAN ") and " USING " not in plan_line
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--verbose", action="store_true", help="print every plan, not only full scans")
+    args = parser.parse_args()
+
+    await seed(args.users)
+    failures = []
+    for name, check in CHECKS.items():
+        for statement, parameters in await capture_statements(check):
+            plan = await explain(statement, parameters)
+            full_scans = [line for line in plan if is_full_scan(line)]
+            print(f"{'FULL SCAN' if full_scans else 'ok':<9} {name}", file=sys.stderr)
+            if full_scans or args.verbose:
+                print("    " + " ".join(statement.split()), file=sys.stderr)
+                for line in plan:
+                    print(f"    | {line}", file=sys.stderr)
+            if full_scans:
+                failures.append(name)
+    await engine.dispose()
+    if DB_PATH is not None and os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    if failures:
+        print(f"{len(failures)} queries fall back to a full scan: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
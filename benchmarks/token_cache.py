@@ -0,0 +1,47 @@
+"""
+Microbenchmark of access token verification with and without the verified-token cache.
+
+    python benchmarks/token_cache.py --requests 20000
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from jose import jwt  # noqa: E402
+
+from auth.utils.keys import key_ring  # noqa: E402
+from auth.utils.security import create_access_token  # noqa: E402
+from auth.utils.security import decode_token  # noqa: E402
+from auth.utils.security import verified_token_cache  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+
+    token = create_access_token(
+        data={"user_id": 1, "email": "user@example.com", "role": 2, "is_active": True},
+        expires_delta=timedelta(minutes=30),
+    )
+
+    def uncached():
+        key = key_ring.get_verification_key(jwt.get_unverified_header(token).get("kid"))
+        jwt.decode(token, key, algorithms=[key_ring.algorithm])
+
+    def cached():
+        decode_token(token)
+
+    verified_token_cache.clear()
+    decode_token(token)
+    for name, func in (("uncached", uncached), ("cached", cached)):
+        seconds = min(timeit.repeat(func, number=args.requests, repeat=3))
+        print(f"{name:>8}: {seconds / args.requests * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Throughput and peak Python memory of the streaming user export, per format and cursor batch size.
+Peak memory should stay flat as --users grows.
+
+    python benchmarks/user_export.py --users 200000
+
+Seeds a temporary SQLite file, or the throwaway database in BENCH_DATABASE_URL.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from bench_database import use_bench_database  # noqa: E402
+
+DB_PATH = use_bench_database("auth_service_user_export_bench.sqlite")
+
+from sqlalchemy import insert  # noqa: E402
+
+from session import engine  # noqa: E402
+from user.exporter import export_users  # noqa: E402
+from user.models import Base, User  # noqa: E402
+
+SEED_CHUNK = 10000
+
+
+async def seed(users: int):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+        for start in range(0, users, SEED_CHUNK):
+            await connection.execute(insert(User), [
+                {"username": f"user{i}", "email": f"user{i}@example.com", "is_active": True,
+                 "hashed_password": "x" * 60, "role": 2}
+                for i in range(start, min(start + SEED_CHUNK, users))
+            ])
+
+
+async def write_export(export_format: str, batch_size: int):
+    with open(os.devnull, "w") as output:
+        async for chunk in export_users(export_format, batch_size):
+            output.write(chunk)
+
+
+async def measure(export_format: str, batch_size: int):
+    """Seconds of writing the whole export to /dev/null, then peak traced bytes of a second, traced run"""
+    started = time.perf_counter()
+    await write_export(export_format, batch_size)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    await write_export(export_format, batch_size)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[500, 2000, 10000])
+    args = parser.parse_args()
+    await seed(args.users)
+    await write_export("csv", args.batch_sizes[0])  # warm the database file cache
+
+    print(f"{'format':<8}{'batch':>8}{'rows/s':>12}{'peak MiB':>10}")
+    for export_format in ("ndjson", "csv"):
+        for batch_size in args.batch_sizes:
+            elapsed, peak = await measure(export_format, batch_size)
+            print(f"{export_format:<8}{batch_size:>8}{args.users / elapsed:>12.0f}{peak / 2 ** 20:>10.1f}")
+    await engine.dispose()
+    if DB_PATH is not None:
+        os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
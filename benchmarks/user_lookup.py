@@ -0,0 +1,84 @@
+"""
+Per-call cost of the user lookups behind login (by email), refresh (by id) and strict
+protected routes (by email): full ORM entity + model_validate against the lean Core path.
+
+    python benchmarks/user_lookup.py --users 1000 --calls 2000
+
+Seeds a temporary SQLite file, or the throwaway database in BENCH_DATABASE_URL.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from bench_database import use_bench_database  # noqa: E402
+
+DB_PATH = use_bench_database("auth_service_user_lookup_bench.sqlite")
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from session import async_session, engine  # noqa: E402
+from user.dals import SQLAlchemyUserDAL  # noqa: E402
+from user.models import Base, User  # noqa: E402
+from user.schemas import UserDTO  # noqa: E402
+
+
+async def seed(users: int):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(insert(User), [
+            {"username": f"user{i}", "email": f"user{i}@example.com", "is_active": True,
+             "hashed_password": "x" * 60, "role": 2}
+            for i in range(users)
+        ])
+
+
+async def orm_lookup(session, field, value):
+    res = await session.execute(select(User).where(getattr(User, field) == value))
+    return UserDTO.model_validate(res.fetchone()[0])
+
+
+async def lean_lookup(session, field, value):
+    return await SQLAlchemyUserDAL(session, cache=None)._get_user_by(field, value)
+
+
+async def measure(lookup, field, values) -> float:
+    """CPU seconds per call, with a session per call like a request"""
+    async with async_session() as session:
+        await lookup(session, field, values[0])
+    started = time.process_time()
+    for value in values:
+        async with async_session() as session:
+            await lookup(session, field, value)
+    return (time.process_time() - started) / len(values)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+    await seed(args.users)
+
+    paths = {
+        "login (email)": ("email", [f"user{i % args.users}@example.com" for i in range(args.calls)]),
+        "refresh (user_id)": ("user_id", [i % args.users + 1 for i in range(args.calls)]),
+    }
+    print(f"{'path':<20}{'orm us/call':>14}{'lean us/call':>14}{'saved':>8}")
+    for name, (field, values) in paths.items():
+        orm = await measure(orm_lookup, field, values)
+        lean = await measure(lean_lookup, field, values)
+        print(f"{name:<20}{orm * 1e6:>14.1f}{lean * 1e6:>14.1f}{1 - lean / orm:>8.0%}")
+    print("protected routes in strict mode resolve the user by email, like login")
+    await engine.dispose()
+    if DB_PATH is not None:
+        os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,2 +1,5 @@
 from .user_router import user_router
-from .login_router import login_router
\ No newline at end of file
+from .login_router import login_router
+from .monitoring_router import monitoring_router
+from .monitoring_router import metrics_router
+from .audit_router import audit_router
@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi import Depends
+from fastapi import Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import settings
+from audit.schemas import AuditEventListResponse
+from audit.schemas import AuditEventType
+from audit.services import _list_audit_events
+from auth import Permission, require
+from auth.schemas import UserPrincipal
+from session import get_async_db
+
+audit_router = APIRouter()
+
+
+@audit_router.get("/events", response_model=AuditEventListResponse)
+async def list_audit_events(
+        limit: int = Query(default=settings.AUDIT_LIST_DEFAULT_LIMIT, ge=1, le=settings.AUDIT_LIST_MAX_LIMIT),
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        event: Optional[AuditEventType] = None,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(require(Permission.VIEW_AUDIT_LOG)),
+) -> AuditEventListResponse:
+    """Events in [since, until), newest first, next_cursor fetches the following page with the same filters"""
+    return await _list_audit_events(
+        limit=limit, cursor=cursor, since=since, until=until, user_id=user_id, event=event, session=db,
+    )
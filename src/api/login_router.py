@@ -3,36 +3,79 @@ from typing import Annotated
 from fastapi import APIRouter
 from fastapi import Depends
 from fastapi import HTTPException, status
+from fastapi import Request
 from fastapi import Response
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import settings
+from audit import AUDIT_LOGIN
+from audit import AUDIT_LOGIN_FAILED
+from audit import AUDIT_LOGIN_REJECTED
+from audit import AUDIT_REFRESH
+from audit import AUDIT_REFRESH_FAILED
+from audit import audit_log
+from auth import Permission
+from auth import require
+from auth.admission import login_admission
 from auth.schemas import RefreshToken
 from auth.schemas import Token
+from auth.schemas import TokenIntrospectionRequest
+from auth.schemas import TokenIntrospectionResponse
+from auth.schemas import UserPrincipal
 from auth.services import authenticate_user, get_current_user_from_token
 from auth.services import create_pair_of_tokens
 from auth.services import get_new_tokens_for_user_by_refresh_token
+from auth.services import get_refresh_token_subject
+from auth.services import introspect_tokens
+from auth.services import revoke_all_user_sessions
+from auth.services import revoke_refresh_token_family
+from auth.utils.keys import key_ring
 from auth.utils.security import OAuth2PasswordBearerWithCookie
 from session import get_async_db
-from user.schemas import UserDTO
 
 login_router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearerWithCookie(tokenUrl="/login/token")
 
 
+def _client_ip(request: Request) -> str:
+    """
+    Client IP for rate limits and the audit log. With AUTH_CLIENT_IP_HEADER it is read from that header,
+    taking the last entry of a list: the one appended by the proxy in front of the service.
+    """
+    if settings.AUTH_CLIENT_IP_HEADER:
+        forwarded = request.headers.get(settings.AUTH_CLIENT_IP_HEADER)
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host
+
+
 @login_router.post("/login", response_model=Token)
 async def login_for_access_and_refresh_token(
+        request: Request,
         response: Response,
         form_data: OAuth2PasswordRequestForm = Depends(),
         db: AsyncSession = Depends(get_async_db)
 ):
-    user = await authenticate_user(form_data.username, form_data.password, db)
+    ip = _client_ip(request)
+    admitted = False
+    try:
+        async with login_admission.admit(ip, form_data.username):
+            admitted = True
+            user = await authenticate_user(form_data.username, form_data.password, db)
+    except HTTPException:
+        if not admitted:
+            # Shed responses stay fast and a flood of them cannot block the audit queue
+            audit_log.record_nowait(AUDIT_LOGIN_REJECTED, account=form_data.username, ip=ip)
+        raise
     if not user:
+        await audit_log.record(AUDIT_LOGIN_FAILED, account=form_data.username, ip=ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
+    await audit_log.record(AUDIT_LOGIN, user_id=user.user_id, account=form_data.username, ip=ip)
     refresh_token, access_token = create_pair_of_tokens(user)
     response.set_cookie(key="access_token", value=f"Bearer {access_token}",
                         httponly=True)
@@ -42,20 +85,79 @@ async def login_for_access_and_refresh_token(
 
 @login_router.post("/refresh", response_model=Token)
 async def login_for_access_token(
+        request: Request,
         response: Response,
         data: RefreshToken,
         db: AsyncSession = Depends(get_async_db),
 ):
-    new_refresh_token, access_token = await get_new_tokens_for_user_by_refresh_token(data.refresh_token, db)
+    try:
+        user, new_refresh_token, access_token = await get_new_tokens_for_user_by_refresh_token(
+            data.refresh_token, db
+        )
+    except HTTPException:
+        user_id, email = get_refresh_token_subject(data.refresh_token)
+        await audit_log.record(AUDIT_REFRESH_FAILED, user_id=user_id, account=email, ip=_client_ip(request))
+        raise
+    await audit_log.record(AUDIT_REFRESH, user_id=user.user_id, ip=_client_ip(request))
     response.set_cookie(key="access_token", value=f"Bearer {access_token}",
                         httponly=True)
     response.set_cookie(key="refresh_token", value=f"Bearer {new_refresh_token}", httponly=True)
     return {"access_token": access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
 
 
+@login_router.post("/logout")
+async def logout(
+        response: Response,
+        data: RefreshToken,
+):
+    """Revoke the session of the refresh token, including every token rotated from it"""
+    await revoke_refresh_token_family(data.refresh_token)
+    response.delete_cookie(key="access_token")
+    response.delete_cookie(key="refresh_token")
+    return {}
+
+
+@login_router.post("/revoke-all")
+async def revoke_all_sessions(
+        response: Response,
+        current_user: Annotated[UserPrincipal, Depends(get_current_user_from_token)],
+):
+    """Revoke every refresh token of the current user, access tokens stay valid until they expire"""
+    await revoke_all_user_sessions(current_user.user_id)
+    response.delete_cookie(key="access_token")
+    response.delete_cookie(key="refresh_token")
+    return {}
+
+
+@login_router.post("/introspect", response_model=TokenIntrospectionResponse, response_model_exclude_none=True)
+async def introspect(
+        data: TokenIntrospectionRequest,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(require(Permission.INTROSPECT_TOKENS)),
+):
+    """
+    Report whether each token is active and its claims, for gateways validating in batches.
+    Callers must authenticate (RFC 7662, section 2.1) with an access token granting INTROSPECT_TOKENS,
+    i.e. log in with an introspection client account (`python cli.py introspection-client <email>`).
+    """
+    return TokenIntrospectionResponse(results=await introspect_tokens(data.tokens, db))
+
+
 # Example
 @login_router.get("/protected-route")
 async def protected_route(
-        current_user: Annotated[UserDTO, Depends(get_current_user_from_token)],
+        current_user: Annotated[UserPrincipal, Depends(get_current_user_from_token)],
 ):
     return {}
+
+
+@login_router.get("/.well-known/jwks.json")
+async def jwks(request: Request):
+    """Public keys for local verification of tokens issued by this service"""
+    headers = {
+        "Cache-Control": f"public, max-age={settings.AUTH_JWKS_MAX_AGE_SECONDS}",
+        "ETag": key_ring.jwks_etag,
+    }
+    if request.headers.get("if-none-match") == key_ring.jwks_etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=key_ring.jwks_json, media_type="application/json", headers=headers)
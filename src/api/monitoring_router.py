@@ -0,0 +1,140 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from audit import audit_log
+from auth import async_hasher
+from auth.admission import login_admission
+from auth.revocation import revocation_store
+from auth.utils.security import verified_token_cache
+from metrics import CONTENT_TYPE, MetricFamily, register_collector, render_metrics
+from session import engine, get_pool_status, replica_engines
+from user.cache import user_cache
+from user.cache import user_lookups
+
+monitoring_router = APIRouter()
+metrics_router = APIRouter()
+
+
+@monitoring_router.get("/pool")
+async def pool_status():
+    """Connection pool usage: checked out, idle, waiting checkouts and time spent waiting"""
+    return {
+        "primary": get_pool_status(engine),
+        "replicas": [get_pool_status(replica) for replica in replica_engines],
+    }
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of request/stage histograms and component stats"""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@register_collector
+def collect_hasher():
+    stats = async_hasher.stats
+    yield MetricFamily("hasher_pending", "gauge", "Password hash jobs queued or running.").add(stats.pending)
+    yield MetricFamily("hasher_queued", "gauge", "Password hash jobs waiting for a free worker.").add(
+        async_hasher.queued
+    )
+    yield MetricFamily("hasher_calls_total", "counter", "Password hash jobs completed.").add(stats.calls)
+    yield MetricFamily("hasher_seconds_total", "counter", "Time spent in password hash jobs.").add(stats.total_seconds)
+    yield MetricFamily("hasher_last_seconds", "gauge", "Duration of the last password hash job.").add(
+        stats.last_seconds
+    )
+    yield MetricFamily("hasher_max_seconds", "gauge", "Longest password hash job since startup.").add(
+        stats.max_seconds
+    )
+
+
+@register_collector
+def collect_caches():
+    hits = MetricFamily("cache_hits_total", "counter", "Cache hits.")
+    misses = MetricFamily("cache_misses_total", "counter", "Cache misses.")
+    entries = MetricFamily("cache_entries", "gauge", "Entries held by the cache.")
+    for name, stats, size in (
+            ("user", user_cache.stats, len(user_cache)),
+            ("verified_token", verified_token_cache.stats, len(verified_token_cache)),
+    ):
+        hits.add(stats.hits, cache=name)
+        misses.add(stats.misses, cache=name)
+        entries.add(size, cache=name)
+    yield from (hits, misses, entries)
+
+
+@register_collector
+def collect_user_lookups():
+    stats = user_lookups.stats
+    yield MetricFamily("user_lookups_in_flight", "gauge", "Distinct user lookup queries running.").add(
+        len(user_lookups)
+    )
+    yield MetricFamily("user_lookups_total", "counter", "User lookups not answered by the cache.").add(stats.calls)
+    yield MetricFamily(
+        "user_lookups_coalesced_total", "counter", "User lookups served by an identical query already in flight."
+    ).add(stats.coalesced)
+
+
+@register_collector
+def collect_pools():
+    families = {
+        "checked_out": MetricFamily("db_pool_checked_out", "gauge", "Connections in use."),
+        "idle": MetricFamily("db_pool_idle", "gauge", "Idle connections in the pool."),
+        "overflow": MetricFamily("db_pool_overflow", "gauge", "Connections opened beyond the pool size."),
+        "waiting": MetricFamily("db_pool_waiting", "gauge", "Checkouts waiting for a connection."),
+        "checkouts": MetricFamily("db_pool_checkouts_total", "counter", "Connection checkouts."),
+        "waits": MetricFamily("db_pool_waits_total", "counter", "Checkouts that waited for a connection."),
+        "total_wait_seconds": MetricFamily(
+            "db_pool_wait_seconds_total", "counter", "Time checkouts spent waiting for a connection."
+        ),
+    }
+    engines = [("primary", engine), *((f"replica{index}", replica) for index, replica in enumerate(replica_engines))]
+    for name, pool_engine in engines:
+        status = get_pool_status(pool_engine)
+        for key, family in families.items():
+            if key in status:
+                family.add(status[key], engine=name)
+    yield from families.values()
+
+
+@register_collector
+def collect_admission():
+    stats = login_admission.stats
+    yield MetricFamily("login_in_flight", "gauge", "Logins verifying a password.").add(stats.in_flight)
+    yield MetricFamily("login_waiting", "gauge", "Logins waiting for admission.").add(stats.waiting)
+    yield MetricFamily("login_admitted_total", "counter", "Logins admitted.").add(stats.admitted)
+    yield (
+        MetricFamily("login_shed_total", "counter", "Logins rejected by admission control.")
+        .add(stats.shed_rate_limited, reason="rate_limited")
+        .add(stats.shed_overloaded, reason="overloaded")
+        .add(stats.shed_timeout, reason="timeout")
+    )
+
+
+@register_collector
+def collect_revocation():
+    stats = revocation_store.stats
+    yield MetricFamily("revocation_checks_total", "counter", "Revocation lookups.").add(stats.checks)
+    yield MetricFamily(
+        "revocation_bloom_negatives_total", "counter", "Revocation lookups answered by the Bloom filter alone."
+    ).add(stats.bloom_negatives)
+    yield MetricFamily(
+        "revocation_backend_lookups_total", "counter", "Revocation lookups reaching the backend."
+    ).add(stats.backend_lookups)
+    yield MetricFamily("revocation_revoked_total", "counter", "Entries revoked by this process.").add(stats.revoked)
+
+
+@register_collector
+def collect_audit():
+    stats = audit_log.stats
+    yield MetricFamily("audit_queue_depth", "gauge", "Audit events waiting to be written.").add(len(audit_log))
+    yield MetricFamily("audit_events_written_total", "counter", "Audit events written.").add(stats.written)
+    yield MetricFamily("audit_batches_total", "counter", "Audit event batches written.").add(stats.batches)
+    yield MetricFamily("audit_flush_failures_total", "counter", "Failed audit batch writes, retried.").add(
+        stats.flush_failures
+    )
+    yield (
+        MetricFamily("audit_backpressure_total", "counter", "Audit events that found the queue full.")
+        .add(stats.blocked, outcome="waited")
+        .add(stats.rejected, outcome="rejected")
+        .add(stats.dropped, outcome="dropped")
+    )
@@ -1,15 +1,29 @@
 from logging import getLogger
 
-from fastapi import APIRouter, Depends
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import settings
+from auth import Permission, require
+from auth.schemas import UserPrincipal
 from auth.services import get_current_user_from_token
 from exceptions import handle_integrity_error, handle_not_found_error, handle_conflict_error, \
     handle_unprocessable_entity_error
 from session import get_async_db
+from user.schemas import BulkUserCreate, BulkUserCreateResponse
+from user.schemas import UserBatchLookup, UserBatchLookupResponse
+from user.schemas import UserListResponse
+from user.schemas import UserImportReport
 from user.schemas import DeleteUserResponse, ShowUser, UpdateUserRequest, UpdatedUserResponse, UserCreate, UserDTO
-from user.services import _create_new_user, _delete_user, _update_user
+from user.services import _create_new_user, _create_new_users, _delete_user, _update_user
+from user.services import _get_users_by
+from user.services import _list_users
+from user.exporter import EXPORT_FORMATS, export_users
+from user.importer import UserImporter, iter_lines
 from user.validations import validate_user_exists, validate_permissions, validate_superadmin, validate_self_modification
 
 logger = getLogger(__name__)
@@ -25,6 +39,76 @@ async def create_user(body: UserCreate, db: AsyncSession = Depends(get_async_db)
         handle_integrity_error(logger, err)
 
 
+@user_router.post("/bulk", response_model=BulkUserCreateResponse)
+async def create_users(
+        body: BulkUserCreate,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(require(Permission.CREATE_USERS)),
+) -> BulkUserCreateResponse:
+    return await _create_new_users(body.users, db)
+
+
+@user_router.post("/batch", response_model=UserBatchLookupResponse)
+async def get_users_batch(
+        body: UserBatchLookup,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(require(Permission.VIEW_USERS)),
+) -> UserBatchLookupResponse:
+    """Resolve many users by ids, emails or usernames in one round-trip, in request order"""
+    field, values = body.lookup
+    users = await _get_users_by(field, values, db)
+    found = {getattr(user, field) for user in users}
+    return UserBatchLookupResponse(
+        users=[ShowUser.model_validate(user) for user in users],
+        missing=[value for value in values if value not in found],
+    )
+
+
+@user_router.get("/list", response_model=UserListResponse)
+async def list_users(
+        limit: int = Query(default=settings.USER_LIST_DEFAULT_LIMIT, ge=1, le=settings.USER_LIST_MAX_LIMIT),
+        cursor: Optional[str] = None,
+        role: Optional[int] = None,
+        is_active: Optional[bool] = None,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: UserPrincipal = Depends(require(Permission.VIEW_USERS)),
+) -> UserListResponse:
+    """Users ordered by id, next_cursor fetches the following page with the same filters"""
+    return await _list_users(limit=limit, cursor=cursor, role=role, is_active=is_active, session=db)
+
+
+@user_router.get("/export", response_class=StreamingResponse)
+async def export_all_users(
+        export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+        current_user: UserPrincipal = Depends(require(Permission.VIEW_USERS)),
+) -> StreamingResponse:
+    """Stream every user as NDJSON or CSV without hashed passwords, memory is bounded by USER_EXPORT_BATCH_SIZE"""
+    return StreamingResponse(
+        export_users(export_format, settings.USER_EXPORT_BATCH_SIZE),
+        media_type=EXPORT_FORMATS[export_format].media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{export_format}"'},
+    )
+
+
+@user_router.post("/import", response_model=UserImportReport)
+async def import_users(
+        request: Request,
+        import_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+        skip: int = Query(default=0, ge=0),
+        current_user: UserPrincipal = Depends(require(Permission.CREATE_USERS | Permission.UPDATE_USERS)),
+) -> UserImportReport:
+    """
+    Upsert users from an NDJSON or CSV request body, parsed while it is uploaded.
+    If the report has an error, resend the same body with skip=records_done to resume.
+    """
+    importer = UserImporter(
+        chunk_size=settings.USER_IMPORT_CHUNK_SIZE,
+        concurrency=settings.USER_IMPORT_CONCURRENCY,
+        max_reported_errors=settings.USER_IMPORT_MAX_REPORTED_ERRORS,
+    )
+    return await importer.run(iter_lines(request.stream()), import_format, skip=skip)
+
+
 # @user_router.get("/", response_model=ShowUser)
 # async def get_user_by_id(
 #         user_id: int,
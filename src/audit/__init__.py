@@ -0,0 +1,6 @@
+from .log import audit_log
+from .schemas import AUDIT_LOGIN
+from .schemas import AUDIT_LOGIN_FAILED
+from .schemas import AUDIT_LOGIN_REJECTED
+from .schemas import AUDIT_REFRESH
+from .schemas import AUDIT_REFRESH_FAILED
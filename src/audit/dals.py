@@ -0,0 +1,53 @@
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import STAGE_DB
+from metrics import timed_stage
+from .models import AuditEvent
+
+_audit_table = AuditEvent.__table__
+
+
+class AuditEventDAL:
+    """Data Access Layer for the audit log"""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    @timed_stage(STAGE_DB)
+    async def insert_events(self, events: List[dict]):
+        """One multi-row INSERT for the whole batch"""
+        await self.db_session.execute(insert(AuditEvent), events)
+
+    @timed_stage(STAGE_DB)
+    async def list_events(
+            self,
+            limit: int,
+            before: Optional[Tuple[float, int]] = None,
+            since: Optional[float] = None,
+            until: Optional[float] = None,
+            user_id: Optional[int] = None,
+            event: Optional[str] = None,
+    ) -> List[dict]:
+        """Keyset page, newest first: seeks past the (occurred_at, id) of the previous page's last event"""
+        query = (
+            select(_audit_table)
+            .order_by(_audit_table.c.occurred_at.desc(), _audit_table.c.id.desc())
+            .limit(limit)
+        )
+        if before is not None:
+            query = query.where(tuple_(_audit_table.c.occurred_at, _audit_table.c.id) < tuple_(*before))
+        if since is not None:
+            query = query.where(_audit_table.c.occurred_at >= since)
+        if until is not None:
+            query = query.where(_audit_table.c.occurred_at < until)
+        if user_id is not None:
+            query = query.where(_audit_table.c.user_id == user_id)
+        if event is not None:
+            query = query.where(_audit_table.c.event == event)
+        res = await self.db_session.execute(query)
+        return [dict(row._mapping) for row in res.fetchall()]
@@ -0,0 +1,160 @@
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from logging import getLogger
+from typing import List, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+import settings
+from exceptions import handle_service_unavailable_error
+from session import primary_session
+from .dals import AuditEventDAL
+
+logger = getLogger(__name__)
+
+# Queued by stop() behind the last event, the flusher exits once it reaches it
+_STOP = object()
+
+
+@dataclass
+class AuditStats:
+    written: int = 0
+    batches: int = 0
+    flush_failures: int = 0
+    # Events that found the queue full and waited for room, and those that gave up after enqueue_timeout
+    blocked: int = 0
+    rejected: int = 0
+    # Events recorded with record_nowait() that found the queue full
+    dropped: int = 0
+
+
+class AuditLog:
+    """
+    Authentication events are queued in memory and written by one background task in multi-row INSERTs.
+    A batch is written once it holds batch_size events or flush_interval after its first event.
+
+    A full queue applies backpressure: recording waits for room, so a slow database slows the requests
+    instead of losing events, and after enqueue_timeout the request fails with 503.
+    A failed batch is retried until it is written. stop() drains the queue within drain_timeout.
+    record_nowait() is for requests that must stay cheap, e.g. shed logins: it drops the event on a full queue.
+    """
+
+    def __init__(self, maxsize: int, batch_size: int, flush_interval: float, enqueue_timeout: float,
+                 drain_timeout: float):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.drain_timeout = drain_timeout
+        self.stats = AuditStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """Start the flusher on the running event loop, events recorded before are ignored"""
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flusher is None:
+            return
+        flusher, self._flusher = self._flusher, None
+        try:
+            await asyncio.wait_for(self._drain(flusher), self.drain_timeout)
+        except asyncio.TimeoutError:
+            flusher.cancel()
+            lost = 0
+            while not self._queue.empty():
+                if self._queue.get_nowait() is not _STOP:
+                    lost += 1
+            logger.error("Audit log stopped before writing at least %s queued events", lost)
+
+    async def _drain(self, flusher: asyncio.Task):
+        await self._queue.put(_STOP)
+        await flusher
+
+    @staticmethod
+    def _row(event: str, user_id: Optional[int], account: Optional[str], ip: Optional[str]) -> dict:
+        return {"occurred_at": time.time(), "event": event, "user_id": user_id, "account": account, "ip": ip}
+
+    async def record(self, event: str, user_id: Optional[int] = None, account: Optional[str] = None,
+                     ip: Optional[str] = None):
+        if self._flusher is None:
+            return
+        row = self._row(event, user_id, account, ip)
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats.blocked += 1
+            try:
+                await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.stats.rejected += 1
+                handle_service_unavailable_error(
+                    "Audit log is overloaded, try again later.", retry_after=math.ceil(self.enqueue_timeout),
+                )
+
+    def record_nowait(self, event: str, user_id: Optional[int] = None, account: Optional[str] = None,
+                      ip: Optional[str] = None):
+        """Queue the event if there is room, never waits: a flood of these cannot block other events"""
+        if self._flusher is None:
+            return
+        try:
+            self._queue.put_nowait(self._row(event, user_id, account, ip))
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            event = await self._queue.get()
+            if event is _STOP:
+                return
+            batch = [event]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        event = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+            await self._write(batch)
+
+    async def _write(self, batch: List[dict]):
+        while True:
+            try:
+                async with primary_session() as session:
+                    async with session.begin():
+                        await AuditEventDAL(session).insert_events(batch)
+            except (SQLAlchemyError, OSError) as err:
+                self.stats.flush_failures += 1
+                logger.warning("Writing %s audit events failed, retrying: %s", len(batch), err)
+                await asyncio.sleep(self.flush_interval)
+                continue
+            self.stats.batches += 1
+            self.stats.written += len(batch)
+            return
+
+
+audit_log = AuditLog(
+    maxsize=settings.AUDIT_QUEUE_MAXSIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    enqueue_timeout=settings.AUDIT_ENQUEUE_TIMEOUT_SECONDS,
+    drain_timeout=settings.AUDIT_DRAIN_TIMEOUT_SECONDS,
+)
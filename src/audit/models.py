@@ -0,0 +1,31 @@
+from sqlalchemy import BigInteger
+from sqlalchemy import Column
+from sqlalchemy import Float
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import String
+
+from user.models import Base
+
+
+class AuditEvent(Base):
+    """
+    Authentication events: logins, refreshes, their failures and logins shed by admission control.
+    occurred_at is a unix timestamp.
+    user_id is not a foreign key, events outlive the accounts they mention.
+    """
+    __tablename__ = "audit_event"
+    __table_args__ = (
+        # Newest first within a time range, for everyone or for one user
+        Index("ix_audit_event_occurred_at_id", "occurred_at", "id"),
+        Index("ix_audit_event_user_id_occurred_at_id", "user_id", "occurred_at", "id"),
+    )
+
+    # SQLite only auto-increments INTEGER primary keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    occurred_at = Column(Float, nullable=False)
+    event = Column(String, nullable=False)
+    user_id = Column(Integer)
+    # Username submitted to the login form, also for unknown accounts
+    account = Column(String)
+    ip = Column(String)
@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel
+
+AUDIT_LOGIN = "login"
+AUDIT_LOGIN_FAILED = "login_failed"
+# Shed by login admission (rate limit or overload) before the password was checked
+AUDIT_LOGIN_REJECTED = "login_rejected"
+AUDIT_REFRESH = "refresh"
+AUDIT_REFRESH_FAILED = "refresh_failed"
+
+AuditEventType = Literal["login", "login_failed", "login_rejected", "refresh", "refresh_failed"]
+
+
+class AuditEventItem(BaseModel):
+    id: int
+    occurred_at: datetime
+    event: AuditEventType
+    user_id: Optional[int]
+    account: Optional[str]
+    ip: Optional[str]
+
+
+class AuditEventListResponse(BaseModel):
+    events: List[AuditEventItem]
+    next_cursor: Optional[str]
@@ -0,0 +1,58 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from exceptions import handle_bad_request_error
+from .dals import AuditEventDAL
+from .schemas import AuditEventItem
+from .schemas import AuditEventListResponse
+
+
+def _encode_audit_cursor(before: Tuple[float, int], filters: dict) -> str:
+    payload = json.dumps({"before": before, "filters": filters}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_audit_cursor(cursor: str, filters: dict) -> Tuple[float, int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        occurred_at, event_id = payload["before"]
+        before = (float(occurred_at), int(event_id))
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        handle_bad_request_error("Invalid cursor.")
+    if payload.get("filters") != filters:
+        handle_bad_request_error("Cursor was issued for different filters.")
+    return before
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    """Naive datetimes are taken as UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+async def _list_audit_events(
+        limit: int, cursor: Optional[str], since: Optional[datetime], until: Optional[datetime],
+        user_id: Optional[int], event: Optional[str], session,
+) -> AuditEventListResponse:
+    filters = {"since": _timestamp(since), "until": _timestamp(until), "user_id": user_id, "event": event}
+    before = _decode_audit_cursor(cursor, filters) if cursor else None
+    async with session.begin():
+        audit_dal = AuditEventDAL(session)
+        events = await audit_dal.list_events(limit=limit + 1, before=before, **filters)
+    next_cursor = None
+    if len(events) > limit:
+        last = events[limit - 1]
+        next_cursor = _encode_audit_cursor((last["occurred_at"], last["id"]), filters)
+    return AuditEventListResponse(
+        events=[
+            AuditEventItem(**{**row, "occurred_at": datetime.fromtimestamp(row["occurred_at"], timezone.utc)})
+            for row in events[:limit]
+        ],
+        next_cursor=next_cursor,
+    )
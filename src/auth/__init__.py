@@ -1,3 +1,6 @@
 from .utils.hashing import Hasher
+from .utils.hashing import async_hasher
 from .services import authenticate_user
 from .services import get_current_user_from_token
+from .services import require
+from .permissions import Permission
@@ -0,0 +1,121 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Hashable
+
+import settings
+from exceptions import handle_service_unavailable_error
+from exceptions import handle_too_many_requests_error
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding window rate limiter.
+    Each key keeps only [window number, previous window count, current window count],
+    the least recently seen keys are dropped once max_keys is reached.
+    """
+
+    def __init__(self, limit: int, window_seconds: float, max_keys: int):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._counters: OrderedDict = OrderedDict()
+
+    def hit(self, key: Hashable) -> float:
+        """Count an attempt, return seconds to wait if the key is over its limit, 0 otherwise"""
+        if self.limit <= 0:
+            return 0
+        now = time.time()
+        window, elapsed = divmod(now, self.window_seconds)
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = [window, 0, 0]
+            self._counters[key] = counter
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+            if counter[0] != window:
+                counter[1] = counter[2] if counter[0] == window - 1 else 0
+                counter[0], counter[2] = window, 0
+        estimated = counter[1] * (1 - elapsed / self.window_seconds) + counter[2]
+        if estimated >= self.limit:
+            return self.window_seconds - elapsed
+        counter[2] += 1
+        return 0
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    in_flight: int = 0
+    waiting: int = 0
+    shed_rate_limited: int = 0
+    shed_overloaded: int = 0
+    shed_timeout: int = 0
+
+
+class LoginAdmission:
+    """
+    Bounded admission for password verification.
+    Per-IP and per-account limits answer 429, a full queue or a too long wait answers 503,
+    so bursts are shed quickly instead of piling up behind bcrypt.
+    """
+
+    def __init__(self, max_concurrent: int, max_waiting: int, wait_timeout: float,
+                 ip_limiter: SlidingWindowLimiter, account_limiter: SlidingWindowLimiter):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.ip_limiter = ip_limiter
+        self.account_limiter = account_limiter
+        self.stats = AdmissionStats()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def _check_rate_limits(self, ip: str, account: str):
+        retry_after = self.ip_limiter.hit(ip) or self.account_limiter.hit(account.lower())
+        if retry_after:
+            self.stats.shed_rate_limited += 1
+            handle_too_many_requests_error("Too many login attempts", math.ceil(retry_after))
+
+    @asynccontextmanager
+    async def admit(self, ip: str, account: str):
+        self._check_rate_limits(ip, account)
+        if self.stats.waiting + self.stats.in_flight >= self.max_concurrent + self.max_waiting:
+            self.stats.shed_overloaded += 1
+            handle_service_unavailable_error("Login is overloaded", math.ceil(self.wait_timeout))
+        self.stats.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.stats.shed_timeout += 1
+            handle_service_unavailable_error("Login is overloaded", math.ceil(self.wait_timeout))
+        finally:
+            self.stats.waiting -= 1
+        self.stats.admitted += 1
+        self.stats.in_flight += 1
+        try:
+            yield
+        finally:
+            self.stats.in_flight -= 1
+            self._semaphore.release()
+
+
+login_admission = LoginAdmission(
+    max_concurrent=settings.AUTH_LOGIN_MAX_CONCURRENT,
+    max_waiting=settings.AUTH_LOGIN_MAX_WAITING,
+    wait_timeout=settings.AUTH_LOGIN_WAIT_TIMEOUT_SECONDS,
+    ip_limiter=SlidingWindowLimiter(
+        limit=settings.AUTH_LOGIN_IP_LIMIT,
+        window_seconds=settings.AUTH_LOGIN_RATE_WINDOW_SECONDS,
+        max_keys=settings.AUTH_LOGIN_RATE_MAX_KEYS,
+    ),
+    account_limiter=SlidingWindowLimiter(
+        limit=settings.AUTH_LOGIN_ACCOUNT_LIMIT,
+        window_seconds=settings.AUTH_LOGIN_RATE_WINDOW_SECONDS,
+        max_keys=settings.AUTH_LOGIN_RATE_MAX_KEYS,
+    ),
+)
@@ -0,0 +1,24 @@
+from sqlalchemy import Column
+from sqlalchemy import Float
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import UniqueConstraint
+
+from user.models import Base
+
+
+class RevokedToken(Base):
+    """
+    Revoked refresh token ids (jti), token families (fid) and per-user cutoffs.
+    Times are unix timestamps, rows can be purged once expires_at has passed.
+    """
+    __tablename__ = "revoked_token"
+    __table_args__ = (
+        UniqueConstraint("kind", "value", name="uq_revoked_token_kind_value"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+    revoked_at = Column(Float, nullable=False)
+    expires_at = Column(Float, nullable=False, index=True)
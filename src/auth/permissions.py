@@ -0,0 +1,39 @@
+from enum import IntFlag
+
+from user.schemas import UserRole
+
+
+class Permission(IntFlag):
+    VIEW_USERS = 1 << 0
+    CREATE_USERS = 1 << 1
+    UPDATE_USERS = 1 << 2
+    DELETE_USERS = 1 << 3
+    # Act on admins: grant or revoke admin privileges, update or delete admin accounts
+    MANAGE_ADMINS = 1 << 4
+    VIEW_AUDIT_LOG = 1 << 5
+    # Call /auth/introspect, granted to gateways through the introspection client role
+    INTROSPECT_TOKENS = 1 << 6
+
+
+NO_PERMISSIONS = Permission(0)
+
+ROLE_PERMISSIONS = {
+    UserRole.ROLE_USER: NO_PERMISSIONS,
+    UserRole.ROLE_ADMIN: (
+            Permission.VIEW_USERS | Permission.CREATE_USERS | Permission.UPDATE_USERS | Permission.DELETE_USERS
+    ),
+    UserRole.ROLE_SUPERADMIN: ~NO_PERMISSIONS,
+    UserRole.ROLE_INTROSPECTION_CLIENT: Permission.INTROSPECT_TOKENS,
+}
+
+
+def permissions_for_role(role: int) -> Permission:
+    """Permission bitmask compiled from the role, unknown roles get none"""
+    try:
+        return ROLE_PERMISSIONS[UserRole(role)]
+    except ValueError:
+        return NO_PERMISSIONS
+
+
+def has_permissions(granted: int, required: int) -> bool:
+    return granted & required == required
@@ -0,0 +1,239 @@
+import hashlib
+import math
+import time
+from abc import ABCMeta, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import settings
+from metrics import STAGE_DB
+from metrics import observe_stage
+from metrics import timed_stage
+from session import primary_session
+from .models import RevokedToken
+
+REVOKED_JTI = "jti"
+REVOKED_FAMILY = "family"
+REVOKED_USER = "user"
+
+# Ids may become visible out of order under concurrent inserts, so every sync re-reads a few recent rows
+SYNC_ID_OVERLAP = 100
+
+
+class BloomFilter:
+    """Fixed size bit array answering "definitely not added" without false negatives"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray(math.ceil(self.size / 8))
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        is_new = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self._bits[position >> 3] & mask:
+                self._bits[position >> 3] |= mask
+                is_new = True
+        if is_new:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+@dataclass
+class RevocationStats:
+    checks: int = 0
+    bloom_negatives: int = 0
+    backend_lookups: int = 0
+    revoked: int = 0
+
+
+class AbstractRevocationStore(metaclass=ABCMeta):
+    """
+    Revocation list of refresh tokens.
+    An in-memory Bloom filter answers the common "not revoked" case, only possible hits reach the backend.
+    """
+
+    def __init__(self):
+        self.stats = RevocationStats()
+        self.bloom = self._new_bloom()
+
+    @staticmethod
+    def _new_bloom() -> BloomFilter:
+        return BloomFilter(
+            capacity=settings.AUTH_REVOCATION_BLOOM_CAPACITY,
+            error_rate=settings.AUTH_REVOCATION_BLOOM_ERROR_RATE,
+        )
+
+    @abstractmethod
+    async def _insert(self, kind: str, value: str, revoked_at: float, expires_at: float) -> bool:
+        """Store the entry, return False if it was already there"""
+
+    @abstractmethod
+    async def _replace(self, kind: str, value: str, revoked_at: float, expires_at: float):
+        pass
+
+    @abstractmethod
+    async def _get_revoked_at(self, kind: str, value: str) -> Optional[float]:
+        pass
+
+    @abstractmethod
+    async def _purge_expired(self, now: float) -> Iterable[Tuple[str, str]]:
+        """Drop expired entries and return keys of the remaining ones"""
+
+    async def sync(self):
+        """Pull revocations made by other processes into the Bloom filter"""
+
+    async def purge_expired(self):
+        bloom = self._new_bloom()
+        for kind, value in await self._purge_expired(time.time()):
+            bloom.add(f"{kind}:{value}")
+        self.bloom = bloom
+
+    async def revoke(self, kind: str, value: str, expires_at: float) -> bool:
+        """Revoke an entry, return False if it had been revoked before"""
+        if self.bloom.count >= self.bloom.capacity:
+            await self.purge_expired()
+        self.bloom.add(f"{kind}:{value}")
+        self.stats.revoked += 1
+        return await self._insert(kind, str(value), time.time(), expires_at)
+
+    async def revoke_user(self, user_id: int, expires_at: float):
+        """Revoke every refresh token issued to the user until now"""
+        self.bloom.add(f"{REVOKED_USER}:{user_id}")
+        self.stats.revoked += 1
+        await self._replace(REVOKED_USER, str(user_id), time.time(), expires_at)
+
+    async def get_revoked_at(self, kind: str, value: str) -> Optional[float]:
+        self.stats.checks += 1
+        await self.sync()
+        if f"{kind}:{value}" not in self.bloom:
+            self.stats.bloom_negatives += 1
+            return None
+        self.stats.backend_lookups += 1
+        return await self._get_revoked_at(kind, str(value))
+
+    async def is_refresh_token_revoked(self, payload: dict) -> bool:
+        if await self.get_revoked_at(REVOKED_FAMILY, payload["fid"]) is not None:
+            return True
+        user_revoked_at = await self.get_revoked_at(REVOKED_USER, payload["user_id"])
+        if user_revoked_at is None:
+            return False
+        if "issued_at" in payload:
+            return payload["issued_at"] < user_revoked_at
+        # Tokens from before the issued_at claim only have whole-second iat
+        return payload.get("iat", 0) <= user_revoked_at
+
+
+class LocalRevocationStore(AbstractRevocationStore):
+    """In-process store, suitable for a single worker and for tests"""
+
+    def __init__(self):
+        super().__init__()
+        self._entries: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    async def _insert(self, kind: str, value: str, revoked_at: float, expires_at: float) -> bool:
+        if (kind, value) in self._entries:
+            return False
+        self._entries[(kind, value)] = (revoked_at, expires_at)
+        return True
+
+    async def _replace(self, kind: str, value: str, revoked_at: float, expires_at: float):
+        self._entries[(kind, value)] = (revoked_at, expires_at)
+
+    async def _get_revoked_at(self, kind: str, value: str) -> Optional[float]:
+        entry = self._entries.get((kind, value))
+        return entry[0] if entry is not None else None
+
+    async def _purge_expired(self, now: float) -> Iterable[Tuple[str, str]]:
+        self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+        return list(self._entries)
+
+
+class DBRevocationStore(AbstractRevocationStore):
+    """
+    Store backed by the revoked_token table, shared by all workers.
+    Revocations made elsewhere reach the local Bloom filter within AUTH_REVOCATION_SYNC_SECONDS.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._last_id = 0
+        self._synced_at = 0.0
+
+    @timed_stage(STAGE_DB)
+    async def _insert(self, kind: str, value: str, revoked_at: float, expires_at: float) -> bool:
+        async with primary_session() as session:
+            try:
+                async with session.begin():
+                    session.add(RevokedToken(kind=kind, value=value, revoked_at=revoked_at, expires_at=expires_at))
+            except IntegrityError:
+                return False
+        return True
+
+    @timed_stage(STAGE_DB)
+    async def _replace(self, kind: str, value: str, revoked_at: float, expires_at: float):
+        async with primary_session() as session:
+            async with session.begin():
+                await session.execute(
+                    delete(RevokedToken).where(RevokedToken.kind == kind, RevokedToken.value == value)
+                )
+                session.add(RevokedToken(kind=kind, value=value, revoked_at=revoked_at, expires_at=expires_at))
+
+    @timed_stage(STAGE_DB)
+    async def _get_revoked_at(self, kind: str, value: str) -> Optional[float]:
+        query = select(RevokedToken.revoked_at).where(RevokedToken.kind == kind, RevokedToken.value == value)
+        async with primary_session() as session:
+            res = await session.execute(query)
+            return res.scalar_one_or_none()
+
+    @timed_stage(STAGE_DB)
+    async def _purge_expired(self, now: float) -> Iterable[Tuple[str, str]]:
+        async with primary_session() as session:
+            async with session.begin():
+                await session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+                res = await session.execute(select(RevokedToken.id, RevokedToken.kind, RevokedToken.value))
+                rows = res.fetchall()
+        self._last_id = max((row.id for row in rows), default=0)
+        self._synced_at = time.monotonic()
+        return [(row.kind, row.value) for row in rows]
+
+    async def sync(self, force: bool = False):
+        if not force and time.monotonic() - self._synced_at < settings.AUTH_REVOCATION_SYNC_SECONDS:
+            return
+        self._synced_at = time.monotonic()
+        query = (
+            select(RevokedToken.id, RevokedToken.kind, RevokedToken.value)
+            .where(RevokedToken.id > self._last_id - SYNC_ID_OVERLAP)
+            .order_by(RevokedToken.id)
+        )
+        with observe_stage(STAGE_DB):
+            async with primary_session() as session:
+                res = await session.execute(query)
+                rows = res.fetchall()
+        for row in rows:
+            self.bloom.add(f"{row.kind}:{row.value}")
+            self._last_id = max(self._last_id, row.id)
+
+
+def get_revocation_store() -> AbstractRevocationStore:
+    if settings.AUTH_REVOCATION_BACKEND == "local":
+        return LocalRevocationStore()
+    return DBRevocationStore()
+
+
+revocation_store = get_revocation_store()
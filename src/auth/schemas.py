@@ -1,4 +1,16 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
+from pydantic import Field
+from pydantic import model_validator
+
+import settings
+
+from user.schemas import TunedModel
+from user.schemas import UserRole
+from .permissions import Permission
+from .permissions import has_permissions
+from .permissions import permissions_for_role
 
 
 class Token(BaseModel):
@@ -10,3 +22,48 @@ class Token(BaseModel):
 class RefreshToken(BaseModel):
     refresh_token: str
 
+
+class UserPrincipal(TunedModel):
+    """Authenticated user as described by the verified access token claims"""
+    user_id: int
+    email: str
+    role: int
+    is_active: bool
+    # Permission bitmask issued in the token, compiled from the role for tokens and users without it
+    perms: Optional[int] = None
+
+    @model_validator(mode="after")
+    def compile_permissions(self):
+        if self.perms is None:
+            self.perms = permissions_for_role(self.role)
+        return self
+
+    @property
+    def is_superadmin(self) -> bool:
+        return self.role == UserRole.ROLE_SUPERADMIN
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == UserRole.ROLE_ADMIN
+
+    def has(self, permission: Permission) -> bool:
+        return has_permissions(self.perms, permission)
+
+
+class TokenIntrospectionRequest(BaseModel):
+    tokens: List[str] = Field(min_length=1, max_length=settings.AUTH_INTROSPECTION_MAX_TOKENS)
+
+
+class TokenIntrospection(BaseModel):
+    active: bool
+    token_type: Optional[str] = None
+    user_id: Optional[int] = None
+    email: Optional[str] = None
+    role: Optional[int] = None
+    perms: Optional[int] = None
+    exp: Optional[int] = None
+    iat: Optional[int] = None
+
+
+class TokenIntrospectionResponse(BaseModel):
+    results: List[TokenIntrospection]
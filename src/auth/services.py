@@ -1,28 +1,54 @@
+import asyncio
+import time
+import uuid
 from datetime import timedelta
-from typing import Optional, Annotated
+from logging import getLogger
+from typing import List, Optional, Annotated, Set, Tuple
 
 from fastapi import Depends
+from fastapi import HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from icecream import ic
 from jose import JWTError
-from jose import jwt
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import settings
+from exceptions import handle_forbidden_error
 from session import get_async_db
+from session import primary_session
 from user.dals import SQLAlchemyUserDAL as UserDAL
 from user.schemas import UserDTO
-from .exceptions import credentials_exception, cannot_create_refresh_token, cannot_create_access_token, user_is_none
-from .utils.hashing import Hasher
+from .revocation import REVOKED_FAMILY
+from .revocation import REVOKED_JTI
+from .revocation import revocation_store
+from .schemas import TokenIntrospection
+from .schemas import UserPrincipal
+from .permissions import Permission
+from .permissions import permissions_for_role
+from .exceptions import credentials_exception, cannot_create_refresh_token, cannot_create_access_token
+from .utils.hashing import async_hasher
+from .utils.hashing import pwd_context
 from .utils.security import create_access_token
+from .utils.security import decode_token
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login/token")
 
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+logger = getLogger(__name__)
+
+# Background rehashes are referenced until done, an unreferenced task may be garbage collected
+_rehash_tasks: Set[asyncio.Task] = set()
+_rehashing_user_ids: Set[int] = set()
+
 
 async def _get_user_by_email_for_auth(email: str, session: AsyncSession):
     async with session.begin():
         user_dal = UserDAL(session)
-        return await user_dal.get_user_by_email(
+        return await user_dal.get_active_user_by_email(
             email=email,
         )
 
@@ -31,35 +57,103 @@ async def authenticate_user(
         email: str, password: str, db: AsyncSession
 ) -> Optional[UserDTO]:
     user = await _get_user_by_email_for_auth(email=email, session=db)
-    if user is None:
+    if user is None or not user.is_active:
         return
-    if not Hasher.verify_password(password, user.hashed_password):
+    if not await async_hasher.verify_password(password, user.hashed_password):
         return
+    if settings.AUTH_REHASH_ON_LOGIN and pwd_context.needs_update(user.hashed_password):
+        _schedule_rehash(user, password)
     return user
 
 
+async def _rehash_password(user: UserDTO, password: str):
+    try:
+        new_hash = await async_hasher.get_password_hash(password)
+        async with primary_session() as session:
+            async with session.begin():
+                await UserDAL(session).update_password_hash(user.user_id, user.hashed_password, new_hash)
+    except SQLAlchemyError as err:
+        logger.warning("Rehash of user %s failed: %s", user.user_id, err)
+    finally:
+        _rehashing_user_ids.discard(user.user_id)
+
+
+def _schedule_rehash(user: UserDTO, password: str):
+    """Move an outdated hash to the current scheme and cost without delaying the login response"""
+    if user.user_id in _rehashing_user_ids:
+        return
+    _rehashing_user_ids.add(user.user_id)
+    task = asyncio.create_task(_rehash_password(user, password))
+    _rehash_tasks.add(task)
+    task.add_done_callback(_rehash_tasks.discard)
+
+
+async def wait_for_rehashes():
+    if _rehash_tasks:
+        await asyncio.gather(*_rehash_tasks, return_exceptions=True)
+
+
+def _get_principal_from_claims(payload: dict) -> UserPrincipal:
+    try:
+        return UserPrincipal.model_validate(payload)
+    except ValidationError:
+        raise credentials_exception
+
+
+async def _get_principal_from_db(payload: dict, db: AsyncSession) -> UserPrincipal:
+    email = payload.get("email")
+    if email is None:
+        raise credentials_exception
+    user = await _get_user_by_email_for_auth(email=email, session=db)
+    if user is None:
+        raise credentials_exception
+    return UserPrincipal.model_validate(user)
+
+
 async def get_current_user_from_token(
-        token: str = Annotated[str, Depends(oauth2_scheme)],
+        token: Annotated[str, Depends(oauth2_scheme)],
         db: AsyncSession = Depends(get_async_db)
-) -> UserDTO:
+) -> UserPrincipal:
+    """
+    Stateless mode trusts the signed claims of the access token.
+    Strict mode (AUTH_TOKEN_VERIFICATION=strict) reloads the user from the database.
+    """
     try:
-        payload = jwt.decode(
-            token, settings.AUTH_SECRET_KEY, algorithms=[settings.AUTH_ALGORITHM]
-        )
-        email: str = payload.get("email")
-        if email is None:
-            raise Exception('email is missing')
+        payload = decode_token(token)
     except JWTError:
-        raise Exception('cannot decode token')
-    user = await _get_user_by_email_for_auth(email=email, session=db)
-    if user is None:
-        raise Exception('user is missing')
-    return UserDTO.model_validate(user)
+        raise credentials_exception
+    if payload.get("type") == REFRESH_TOKEN_TYPE:
+        raise credentials_exception
+    if settings.AUTH_TOKEN_VERIFICATION == "strict":
+        user = await _get_principal_from_db(payload, db)
+    else:
+        user = _get_principal_from_claims(payload)
+    if not user.is_active:
+        raise credentials_exception
+    return user
+
+
+def require(permission: Permission):
+    """
+    Dependency resolving the current user and checking the permission against the token bitmask,
+    e.g. `current_user: UserPrincipal = Depends(require(Permission.VIEW_USERS))`
+    """
+
+    async def check_permission(
+            current_user: UserPrincipal = Depends(get_current_user_from_token),
+    ) -> UserPrincipal:
+        if not current_user.has(permission):
+            handle_forbidden_error("Forbidden.")
+        return current_user
 
+    return check_permission
 
-def create_pair_of_tokens(user: UserDTO) -> (str, str):
+
+def create_pair_of_tokens(user: UserDTO, family_id: Optional[str] = None) -> (str, str):
     """
     Create new token pair: access and refresh tokens.
+    Every refresh token gets its own jti and keeps the family id of the login it descends from.
+    `issued_at` is the sub-second issue time the revoke-all cutoff is compared with, `iat` has whole seconds.
     """
     if not user:
         raise Exception('User is None')
@@ -69,6 +163,10 @@ def create_pair_of_tokens(user: UserDTO) -> (str, str):
             data={
                 "user_id": user.user_id,
                 "email": user.email,
+                "type": REFRESH_TOKEN_TYPE,
+                "jti": uuid.uuid4().hex,
+                "fid": family_id or uuid.uuid4().hex,
+                "issued_at": time.time(),
             },
 
             expires_delta=refresh_token_expires,
@@ -83,6 +181,9 @@ def create_pair_of_tokens(user: UserDTO) -> (str, str):
                 "user_id": user.user_id,
                 "email": user.email,
                 "role": user.role,
+                "perms": int(permissions_for_role(user.role)),
+                "is_active": user.is_active,
+                "type": ACCESS_TOKEN_TYPE,
                 "refresh_expires": refresh_token_expires.total_seconds(),
             },
 
@@ -94,28 +195,118 @@ def create_pair_of_tokens(user: UserDTO) -> (str, str):
     return refresh_token, access_token
 
 
+def _decode_refresh_token_claims(payload: dict) -> dict:
+    if payload.get("type") != REFRESH_TOKEN_TYPE or not all(payload.get(claim) for claim in ("user_id", "jti", "fid")):
+        raise credentials_exception
+    return payload
+
+
+def _decode_refresh_token(token: str) -> dict:
+    try:
+        payload = decode_token(token)
+    except JWTError:
+        raise credentials_exception
+    return _decode_refresh_token_claims(payload)
+
+
+def get_refresh_token_subject(token: str) -> Tuple[Optional[int], Optional[str]]:
+    """User id and email of a validly signed token, for auditing a failed refresh, e.g. of a reused token"""
+    try:
+        payload = decode_token(token)
+    except JWTError:
+        return None, None
+    return payload.get("user_id"), payload.get("email")
+
+
 async def check_refresh_token_and_get_user(
         token: str, db: AsyncSession,
-) -> UserDTO:
-    payload = jwt.decode(
-        token, settings.AUTH_SECRET_KEY, algorithms=[settings.AUTH_ALGORITHM]
-    )
-    user_id: int = payload.get("user_id")
-    if user_id is None:
-        raise user_is_none
-    user_dal = UserDAL(db)
-    user = await user_dal.get_user_by_id(user_id=user_id)
-    if not user:
-        raise user_is_none
+) -> (UserDTO, dict):
+    payload = _decode_refresh_token(token)
+    if await revocation_store.is_refresh_token_revoked(payload):
+        raise credentials_exception
+    async with db.begin():
+        user_dal = UserDAL(db)
+        user = await user_dal.get_user_by_id(user_id=payload["user_id"])
+    if not user or not user.is_active:
+        raise credentials_exception
 
-    return user
+    return user, payload
 
 
 async def get_new_tokens_for_user_by_refresh_token(
         token: str,
         db: AsyncSession,
 ):
-    user = await check_refresh_token_and_get_user(token, db)
-    refresh_token, access_token = create_pair_of_tokens(user)
-    return refresh_token, access_token
+    """
+    Rotate the refresh token: the presented one is revoked and a new pair of the same family is issued.
+    Presenting an already rotated token means it leaked, so the whole family is revoked.
+    """
+    user, payload = await check_refresh_token_and_get_user(token, db)
+    if not await revocation_store.revoke(REVOKED_JTI, payload["jti"], expires_at=payload["exp"]):
+        await revocation_store.revoke(REVOKED_FAMILY, payload["fid"], expires_at=_family_expires_at())
+        raise credentials_exception
+    refresh_token, access_token = create_pair_of_tokens(user, family_id=payload["fid"])
+    return user, refresh_token, access_token
+
+
+def _family_expires_at() -> float:
+    """A family lives as long as the newest refresh token that could be issued in it"""
+    return time.time() + settings.AUTH_REFRESH_TOKEN_EXPIRE_MINUTES * 60
+
+
+async def revoke_refresh_token_family(token: str):
+    payload = _decode_refresh_token(token)
+    await revocation_store.revoke(REVOKED_FAMILY, payload["fid"], expires_at=_family_expires_at())
+
+
+async def revoke_all_user_sessions(user_id: int):
+    await revocation_store.revoke_user(user_id, expires_at=_family_expires_at())
 
+
+async def _introspect(payload: Optional[dict], users_by_email: dict) -> TokenIntrospection:
+    inactive = TokenIntrospection(active=False)
+    if payload is None:
+        return inactive
+    strict = settings.AUTH_TOKEN_VERIFICATION == "strict"
+    user = users_by_email.get(payload.get("email"))
+    if strict and (user is None or not user.is_active):
+        return inactive
+    if payload.get("type") == REFRESH_TOKEN_TYPE:
+        try:
+            payload = _decode_refresh_token_claims(payload)
+        except HTTPException:
+            return inactive
+        if await revocation_store.is_refresh_token_revoked(payload) \
+                or await revocation_store.get_revoked_at(REVOKED_JTI, payload["jti"]) is not None:
+            return inactive
+        return TokenIntrospection.model_validate({**payload, "active": True, "token_type": REFRESH_TOKEN_TYPE})
+    try:
+        principal = UserPrincipal.model_validate(user) if strict else _get_principal_from_claims(payload)
+    except HTTPException:
+        return inactive
+    if not principal.is_active:
+        return inactive
+    return TokenIntrospection.model_validate(
+        {**payload, **principal.model_dump(), "active": True, "token_type": ACCESS_TOKEN_TYPE}
+    )
+
+
+async def introspect_tokens(tokens: List[str], db: AsyncSession) -> List[TokenIntrospection]:
+    """
+    RFC 7662 style introspection of many tokens at once.
+    Tokens are verified like in get_current_user_from_token, strict mode loads all their users with one query.
+    """
+    payloads = []
+    for token in tokens:
+        try:
+            payloads.append(decode_token(token))
+        except JWTError:
+            payloads.append(None)
+    users_by_email = {}
+    if settings.AUTH_TOKEN_VERIFICATION == "strict":
+        emails = [payload["email"] for payload in payloads if payload and payload.get("email")]
+        if emails:
+            async with db.begin():
+                users = await UserDAL(db).get_users_by_emails(emails)
+            users_by_email = {user.email: user for user in users}
+    return [await _introspect(payload, users_by_email) for payload in payloads]
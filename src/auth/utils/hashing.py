@@ -1,7 +1,29 @@
+import asyncio
+import math
+import time
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
 from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+
+import settings
+from metrics import STAGE_HASH
+from metrics import observe_stage
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# scheme: (cost sampled by the calibration, lowest and highest cost it may pick, whether the cost is log2 of the work)
+# Costs are bcrypt rounds and argon2 time cost, passlib calls both "rounds"
+_COST_CALIBRATION = {
+    "bcrypt": (8, 10, 16, True),
+    "argon2": (1, 2, 16, False),
+}
+_CALIBRATION_SAMPLES = 3
+
 
 class Hasher:
     @staticmethod
@@ -11,3 +33,149 @@ class Hasher:
     @staticmethod
     def get_password_hash(password: str) -> str:
         return pwd_context.hash(password)
+
+    @staticmethod
+    def is_password_hash(value: str) -> bool:
+        """Whether the value is a well-formed hash of a scheme pwd_context can verify"""
+        scheme = pwd_context.identify(value)
+        if scheme is None:
+            return False
+        try:
+            pwd_context.handler(scheme).from_string(value)
+        except ValueError:
+            return False
+        return True
+
+
+def calibrate_cost(scheme: str, target_seconds: float) -> Optional[int]:
+    """Cost of the scheme whose hash takes about target_seconds on this machine, None if it cannot be calibrated"""
+    if scheme not in _COST_CALIBRATION:
+        return None
+    sample_cost, min_cost, max_cost, exponential = _COST_CALIBRATION[scheme]
+    handler = get_crypt_handler(scheme).using(rounds=sample_cost)
+    elapsed = float("inf")
+    for _ in range(_CALIBRATION_SAMPLES):
+        started = time.perf_counter()
+        handler.hash("calibration password")
+        elapsed = min(elapsed, time.perf_counter() - started)
+    ratio = target_seconds / elapsed
+    cost = sample_cost + round(math.log2(ratio)) if exponential else round(sample_cost * ratio)
+    return min(max_cost, max(min_cost, cost))
+
+
+def get_password_context_options() -> dict:
+    """
+    CryptContext options from settings, calibrating the cost of the default scheme when it is not pinned.
+    The cost is also the minimum one: weaker hashes need an update and get rehashed on login,
+    stronger ones are kept, so nodes calibrating to different costs never rehash each other's hashes back.
+    """
+    schemes = settings.AUTH_PASSWORD_SCHEMES
+    handler = get_crypt_handler(schemes[0])
+    if hasattr(handler, "has_backend") and not handler.has_backend():
+        raise ValueError(f"Password scheme {schemes[0]} has no backend installed, e.g. argon2-cffi for argon2")
+    options = {"schemes": schemes, "deprecated": "auto"}
+    cost = settings.AUTH_HASH_COST or calibrate_cost(schemes[0], settings.AUTH_HASH_TARGET_MS / 1000)
+    if cost:
+        options[f"{schemes[0]}__default_rounds"] = cost
+        options[f"{schemes[0]}__min_rounds"] = cost
+    return options
+
+
+def configure_password_context(options: dict):
+    """Replace the pwd_context configuration, also the initializer of process pool workers"""
+    pwd_context.load(options)
+
+
+@dataclass
+class HasherStats:
+    pending: int = 0
+    calls: int = 0
+    total_seconds: float = 0.0
+    last_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def observe(self, seconds: float):
+        self.calls += 1
+        self.total_seconds += seconds
+        self.last_seconds = seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+class AsyncHasher:
+    """
+    Runs Hasher calls on a bounded worker pool so bcrypt never blocks the event loop.
+    The pool is created on first use and can be thread or process based.
+    Bulk hashing (batch create, import) holds at most bulk_concurrency workers at once,
+    the others stay free for logins.
+    """
+
+    def __init__(self, executor_type: str = "thread", max_workers: Optional[int] = None,
+                 bulk_concurrency: int = 1):
+        if executor_type not in ("thread", "process"):
+            raise ValueError(f"Unknown hasher executor type: {executor_type}")
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self._bulk_slots = asyncio.Semaphore(bulk_concurrency)
+        self.stats = HasherStats()
+        self._executor: Optional[Executor] = None
+        self._context_options: Optional[dict] = None
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a free worker"""
+        return max(0, self.stats.pending - (self.max_workers or 1))
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                # Workers import a default pwd_context, the initializer applies the configured one
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=configure_password_context if self._context_options else None,
+                    initargs=(self._context_options,) if self._context_options else (),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="hasher"
+                )
+        return self._executor
+
+    def configure(self, options: dict):
+        """Apply password context options in this process and in the workers of a process pool"""
+        configure_password_context(options)
+        self._context_options = options
+        if self.executor_type == "process":
+            self.shutdown()
+
+    async def _run(self, func: Callable, *args):
+        loop = asyncio.get_running_loop()
+        self.stats.pending += 1
+        started = time.perf_counter()
+        try:
+            with observe_stage(STAGE_HASH):
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.stats.pending -= 1
+            self.stats.observe(time.perf_counter() - started)
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(Hasher.verify_password, plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str) -> str:
+        return await self._run(Hasher.get_password_hash, password)
+
+    async def get_password_hash_bulk(self, password: str) -> str:
+        async with self._bulk_slots:
+            return await self._run(Hasher.get_password_hash, password)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+async_hasher = AsyncHasher(
+    executor_type=settings.AUTH_HASHER_EXECUTOR,
+    max_workers=settings.AUTH_HASHER_MAX_WORKERS,
+    bulk_concurrency=settings.AUTH_HASHER_BULK_CONCURRENCY,
+)
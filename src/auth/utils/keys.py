@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+from jose import jwk
+from jose.backends.base import Key
+from jose.constants import ALGORITHMS
+
+import settings
+
+
+class KeyRing:
+    """
+    Signing and verification keys, parsed once and reused for every encode/decode.
+
+    HMAC algorithms use AUTH_SECRET_KEY and publish nothing.
+    RSA/EC algorithms load every `<kid>.pem` file of AUTH_KEYS_DIR: private keys can sign and verify,
+    public-only files keep verifying tokens of retired keys. All of them are published in the JWKS.
+    """
+
+    def __init__(self, algorithm: str, signing_kid: Optional[str], signing_key: Key,
+                 verification_keys: Dict[Optional[str], Key]):
+        self.algorithm = algorithm
+        self.signing_kid = signing_kid
+        self.signing_key = signing_key
+        self.verification_keys = verification_keys
+        self.jwks = self._build_jwks()
+        self.jwks_json = json.dumps(self.jwks, separators=(",", ":")).encode()
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks_json).hexdigest()[:32]}"'
+
+    @classmethod
+    def from_settings(cls) -> "KeyRing":
+        algorithm = settings.AUTH_ALGORITHM
+        if algorithm in ALGORITHMS.HMAC:
+            key = jwk.construct(settings.AUTH_SECRET_KEY, algorithm)
+            return cls(algorithm, None, key, {None: key})
+        if algorithm not in ALGORITHMS.RSA_DS | ALGORITHMS.EC_DS:
+            raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+        keys = cls._load_keys(settings.AUTH_KEYS_DIR, algorithm)
+        private_kids = sorted(kid for kid, key in keys.items() if not key.is_public())
+        signing_kid = settings.AUTH_SIGNING_KEY_ID or (private_kids[-1] if private_kids else None)
+        if signing_kid not in private_kids:
+            raise ValueError(f"No private key for signing key id {signing_kid} in {settings.AUTH_KEYS_DIR}")
+        verification_keys = {kid: key.public_key() for kid, key in keys.items()}
+        return cls(algorithm, signing_kid, keys[signing_kid], verification_keys)
+
+    @staticmethod
+    def _load_keys(keys_dir: str, algorithm: str) -> Dict[str, Key]:
+        if not keys_dir or not os.path.isdir(keys_dir):
+            raise ValueError(f"AUTH_KEYS_DIR must point to a directory with PEM keys for {algorithm}")
+        keys = {}
+        for file_name in sorted(os.listdir(keys_dir)):
+            if not file_name.endswith(".pem"):
+                continue
+            with open(os.path.join(keys_dir, file_name)) as key_file:
+                keys[file_name[:-len(".pem")]] = jwk.construct(key_file.read(), algorithm)
+        return keys
+
+    def _build_jwks(self) -> dict:
+        if self.signing_kid is None:
+            return {"keys": []}
+        return {"keys": [
+            {**key.to_dict(), "kid": kid, "use": "sig"}
+            for kid, key in self.verification_keys.items()
+        ]}
+
+    def get_verification_key(self, kid: Optional[str]) -> Optional[Key]:
+        return self.verification_keys.get(kid)
+
+
+key_ring = KeyRing.from_settings()
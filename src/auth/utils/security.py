@@ -1,3 +1,5 @@
+import hashlib
+import time
 from datetime import datetime
 from datetime import timedelta
 from typing import Optional, Dict
@@ -6,9 +8,17 @@ from fastapi import Request, HTTPException, status
 from fastapi.openapi.models import OAuthFlows as OAuthFlowsModel
 from fastapi.security import OAuth2
 from fastapi.security.utils import get_authorization_scheme_param
+from jose import JWTError
 from jose import jwt
 
 import settings
+from cache import TTLCache
+from metrics import STAGE_JWT_DECODE
+from metrics import STAGE_JWT_ENCODE
+from metrics import observe_stage
+from .keys import key_ring
+
+verified_token_cache = TTLCache(maxsize=settings.AUTH_TOKEN_CACHE_MAXSIZE)
 
 
 class OAuth2PasswordBearerWithCookie(OAuth2):
@@ -49,9 +59,31 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(
             minutes=settings.AUTH_ACCESS_TOKEN_EXPIRE_MINUTES
         )
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(
-        to_encode, settings.AUTH_SECRET_KEY, algorithm=settings.AUTH_ALGORITHM
-    )
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
+    headers = {"kid": key_ring.signing_kid} if key_ring.signing_kid else None
+    with observe_stage(STAGE_JWT_ENCODE):
+        encoded_jwt = jwt.encode(
+            to_encode, key_ring.signing_key, algorithm=key_ring.algorithm, headers=headers
+        )
     return encoded_jwt
 
+
+def decode_token(token: str) -> dict:
+    """
+    Verify a JWT and return its claims.
+    Claims of verified tokens are cached by token digest until the token expires,
+    the returned dict is shared and must not be mutated.
+    """
+    with observe_stage(STAGE_JWT_DECODE):
+        digest = hashlib.sha256(token.encode()).digest()
+        claims = verified_token_cache.get(digest)
+        if claims is not None:
+            return claims
+        key = key_ring.get_verification_key(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise JWTError("Unknown signing key")
+        claims = jwt.decode(token, key, algorithms=[key_ring.algorithm])
+    ttl = claims.get("exp", 0) - time.time()
+    if ttl > 0:
+        verified_token_cache.set(digest, claims, ttl=ttl)
+    return claims
@@ -0,0 +1,137 @@
+"""
+Maintenance commands, run from src/ with the same environment as the service:
+
+    python cli.py export --format csv --output users.csv
+    python cli.py import users.csv
+    python cli.py introspection-client gateway@example.com
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import settings
+from auth import async_hasher
+from auth.utils.hashing import get_password_context_options
+from session import engine, primary_session, replica_engines
+from user.dals import SQLAlchemyUserDAL as UserDAL
+from user.exporter import EXPORT_FORMATS, stream_user_rows
+from user.importer import IMPORT_PARSERS, UserImporter
+from user.schemas import UserRole
+
+
+async def export_command(args):
+    serializer = EXPORT_FORMATS[args.format]
+    output = open(args.output, "w", newline="") if args.output != "-" else sys.stdout
+    rows = 0
+    started = time.perf_counter()
+    try:
+        output.write(serializer.header())
+        async for partition in stream_user_rows(args.batch_size):
+            output.write(serializer.chunk(partition))
+            rows += len(partition)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - started
+    print(f"exported {rows} users in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
+
+
+async def iter_file_lines(path: str):
+    with open(path, encoding="utf-8-sig", newline="") as input_file:
+        for line in input_file:
+            yield line
+
+
+def read_checkpoint(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)["records_done"]
+
+
+def write_checkpoint(path: str, records_done: int):
+    """Replace the file atomically, a crash never leaves a half-written checkpoint"""
+    with open(f"{path}.tmp", "w") as checkpoint_file:
+        json.dump({"records_done": records_done}, checkpoint_file)
+    os.replace(f"{path}.tmp", path)
+
+
+async def import_command(args):
+    import_format = args.format or os.path.splitext(args.input)[1].lstrip(".").lower()
+    if import_format not in IMPORT_PARSERS:
+        raise SystemExit(f"Unknown format of {args.input}, pass --format")
+    checkpoint = args.checkpoint or f"{args.input}.checkpoint"
+    skip = read_checkpoint(checkpoint)
+    if skip:
+        print(f"resuming after record {skip}", file=sys.stderr)
+    importer = UserImporter(
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        max_reported_errors=settings.USER_IMPORT_MAX_REPORTED_ERRORS,
+        on_checkpoint=lambda records_done: write_checkpoint(checkpoint, records_done),
+    )
+    started = time.perf_counter()
+    report = await importer.run(iter_file_lines(args.input), import_format, skip=skip)
+    elapsed = time.perf_counter() - started
+    print(report.model_dump_json(indent=2))
+    rate = report.records / elapsed if elapsed else 0
+    print(f"processed {report.records} records in {elapsed:.2f}s ({rate:.0f} records/s)", file=sys.stderr)
+    if report.error is not None:
+        raise SystemExit(f"import stopped, rerun the same command to resume after record {report.records_done}")
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+async def introspection_client_command(args):
+    """Turn an existing regular account into an introspection client: it may introspect tokens and nothing else"""
+    async with primary_session() as session:
+        async with session.begin():
+            user_dal = UserDAL(session)
+            user = await user_dal.get_user_by_email(args.email)
+            if user is None:
+                raise SystemExit(f"No user with email {args.email}")
+            if user.role != UserRole.ROLE_USER:
+                raise SystemExit(f"{args.email} is not a regular user")
+            await user_dal.update_user(user.user_id, role=UserRole.ROLE_INTROSPECTION_CLIENT)
+    print(f"{args.email} is an introspection client", file=sys.stderr)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="stream all users to NDJSON or CSV, without passwords")
+    export_parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    export_parser.add_argument("--output", default="-", help="file path, - for stdout")
+    export_parser.add_argument("--batch-size", type=int, default=settings.USER_EXPORT_BATCH_SIZE)
+    export_parser.set_defaults(handler=export_command)
+
+    import_parser = commands.add_parser("import", help="upsert users from NDJSON or CSV, resumable")
+    import_parser.add_argument("input", help="file path, the format is taken from its extension")
+    import_parser.add_argument("--format", choices=sorted(IMPORT_PARSERS))
+    import_parser.add_argument("--checkpoint", help="progress file, <input>.checkpoint by default")
+    import_parser.add_argument("--chunk-size", type=int, default=settings.USER_IMPORT_CHUNK_SIZE)
+    import_parser.add_argument("--concurrency", type=int, default=settings.USER_IMPORT_CONCURRENCY)
+    import_parser.set_defaults(handler=import_command)
+
+    client_parser = commands.add_parser(
+        "introspection-client", help="let an existing account call /auth/introspect, without admin permissions"
+    )
+    client_parser.add_argument("email")
+    client_parser.set_defaults(handler=introspection_client_command)
+
+    args = parser.parse_args()
+    async_hasher.configure(get_password_context_options())
+    try:
+        await args.handler(args)
+    finally:
+        async_hasher.shutdown()
+        for used_engine in [engine, *replica_engines]:
+            await used_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
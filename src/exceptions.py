@@ -27,3 +27,11 @@ def handle_bad_request_error(detail: str):
 
 def handle_unprocessable_entity_error(detail: str):
     raise HTTPException(status_code=422, detail=detail)
+
+
+def handle_too_many_requests_error(detail: str, retry_after: int):
+    raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+def handle_service_unavailable_error(detail: str, retry_after: int):
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
@@ -1,20 +1,48 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import settings
-from api import user_router, login_router
+from api import user_router, login_router, monitoring_router, metrics_router, audit_router
+from audit import audit_log
+from auth import async_hasher
+from auth.revocation import revocation_store
+from auth.services import wait_for_rehashes
+from auth.utils.hashing import get_password_context_options
+from metrics import MetricsMiddleware, TimedJSONResponse
+from session import engine, replica_engines, warmup_engine
+from user.dals import warmup_user_queries
 
 
 def custom_generate_unique_id(route: APIRoute):
     return f"{route.tags[0]}-{route.name}"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async_hasher.configure(get_password_context_options())
+    for warmed_engine in [engine, *replica_engines]:
+        await warmup_engine(warmed_engine, settings.DB_WARMUP_CONNECTIONS)
+        async with AsyncSession(warmed_engine) as session:
+            await warmup_user_queries(session)
+    await revocation_store.purge_expired()
+    audit_log.start()
+    yield
+    await wait_for_rehashes()
+    await audit_log.stop()
+    async_hasher.shutdown()
+
+
 app = FastAPI(
     generate_unique_id_function=custom_generate_unique_id,
-    title='auth-service'
+    title='auth-service',
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
 )
 
 origins = ['*']
@@ -25,9 +53,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(user_router, prefix="/user", tags=["user"])
 app.include_router(login_router, prefix="/auth", tags=["auth"])
+app.include_router(monitoring_router, prefix="/monitoring", tags=["monitoring"])
+app.include_router(audit_router, prefix="/audit", tags=["audit"])
+app.include_router(metrics_router, tags=["monitoring"])
 
 
 # Exception Handlers
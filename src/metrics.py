@@ -0,0 +1,216 @@
+import bisect
+import functools
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi.responses import JSONResponse
+
+import settings
+
+STAGE_HASH = "hash"
+STAGE_DB = "db"
+STAGE_JWT_ENCODE = "jwt_encode"
+STAGE_JWT_DECODE = "jwt_decode"
+STAGE_SERIALIZE = "serialize"
+
+# Route label of stages timed outside of a request, e.g. by the CLI or at startup
+NO_ROUTE = "none"
+UNMATCHED_ROUTE = "unmatched"
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets: int):
+        # One count per bucket upper bound plus the +Inf bucket, cumulated only when rendered
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+
+
+class Histogram:
+    """
+    Prometheus histogram without client library: one series per label values tuple.
+    Observing is a dict lookup, a bisect and two additions. Not thread safe, meant for the event loop.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, _HistogramSeries] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues, series in sorted(self._series.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series.counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {series.sum}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+@dataclass
+class MetricFamily:
+    """Gauges or counters read from existing stats objects when metrics are scraped"""
+    name: str
+    type: str
+    documentation: str
+    samples: List[Tuple[Dict[str, str], float]] = field(default_factory=list)
+
+    def add(self, value: float, **labels: str) -> "MetricFamily":
+        self.samples.append((labels, value))
+        return self
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labels, value in self.samples:
+            yield f"{self.name}{_format_labels(labels)} {float(value)}"
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by method, route template and status.",
+    ("method", "route", "status"),
+)
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds",
+    "Time spent in one stage of request handling: hash, db, jwt_encode, jwt_decode or serialize.",
+    ("route", "stage"),
+)
+
+_collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[MetricFamily]]):
+    _collectors.append(collector)
+    return collector
+
+
+def render_metrics() -> str:
+    lines = [*HTTP_REQUEST_DURATION.render(), *STAGE_DURATION.render()]
+    for collector in _collectors:
+        for family in collector():
+            lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+# ASGI scope of the request being handled, the router stores the matched route in it
+_current_scope: ContextVar[Optional[dict]] = ContextVar("metrics_scope", default=None)
+
+
+def _current_route() -> str:
+    scope = _current_scope.get()
+    if scope is None:
+        return NO_ROUTE
+    route = scope.get("route")
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+
+class StageTimer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if settings.METRICS_ENABLED:
+            STAGE_DURATION.observe(time.perf_counter() - self.started, _current_route(), self.stage)
+
+
+def observe_stage(stage: str) -> StageTimer:
+    """`with observe_stage(STAGE_DB): ...` records the block under the current request route"""
+    return StageTimer(stage)
+
+
+def timed_stage(stage: str):
+    """Decorator recording every call of a coroutine function as a stage"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with StageTimer(stage):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request by method, route template and status.
+    Unlike BaseHTTPMiddleware it adds no extra task per request, and stages see the request scope.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _current_scope.set(scope)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current_scope.reset(token)
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route.path if route is not None else UNMATCHED_ROUTE,
+                str(status),
+            )
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSON response recording the encoding of its body as the serialize stage"""
+
+    def render(self, content) -> bytes:
+        with StageTimer(STAGE_SERIALIZE):
+            return super().render(content)
@@ -1,26 +1,231 @@
-from typing import Generator
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Generator, List, Optional
 
+from sqlalchemy import Select
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
+from sqlalchemy.util.queue import Empty
 
 import settings
 
+
+@dataclass
+class PoolWaitStats:
+    waiting: int = 0
+    checkouts: int = 0
+    # Checkouts that found no idle connection and no room to open one, and their time blocked on the pool
+    waits: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    def observe_wait(self, seconds: float):
+        self.waits += 1
+        self.total_wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+class _TimedAsyncAdaptedQueue(AsyncAdaptedQueue):
+    """Idle connections of the pool, times the gets that find none and have to block until one is returned"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        if not block:
+            return super().get(block, timeout)
+        try:
+            return self.get_nowait()
+        except Empty:
+            pass
+        self.wait_stats.waiting += 1
+        started = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            self.wait_stats.waiting -= 1
+            self.wait_stats.observe_wait(time.perf_counter() - started)
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how many checkouts wait for a connection and for how long.
+    Checkouts served by an idle connection or by opening a new one within max_overflow do not count as waits.
+    """
+
+    _queue_class = _TimedAsyncAdaptedQueue
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = self._pool.wait_stats
+
+    def _do_get(self):
+        self.wait_stats.checkouts += 1
+        return super()._do_get()
+
+
+def _get_engine_options(database_url: str) -> dict:
+    options = dict(
+        future=True,
+        echo=settings.DB_ECHO,
+        execution_options={"isolation_level": "AUTOCOMMIT"},
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    )
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    )
+    return options
+
+
 engine = create_async_engine(
     settings.ASYNC_DATABASE_URL,
-    future=True,
-    echo=True,
-    execution_options={"isolation_level": "AUTOCOMMIT"},
+    **_get_engine_options(settings.ASYNC_DATABASE_URL),
 )
 
+
+def _get_checked_out(engine: AsyncEngine) -> int:
+    pool = engine.sync_engine.pool
+    return pool.checkedout() if isinstance(pool, AsyncAdaptedQueuePool) else 0
+
+
+replica_engines = [
+    create_async_engine(url, **_get_engine_options(url))
+    for url in settings.ASYNC_DATABASE_REPLICA_URLS
+]
+
+# Session.info flag routing every statement of the session to the primary
+USE_PRIMARY = "use_primary"
+
+
+class ReplicaSelector:
+    """Picks the replica engine for the next read: round-robin or the one with fewest checked out connections"""
+
+    def __init__(self, engines: List[AsyncEngine], strategy: str):
+        if strategy not in ("round_robin", "least_busy"):
+            raise ValueError(f"Unknown replica selection strategy: {strategy}")
+        self.engines = engines
+        self.strategy = strategy
+        self._round_robin = itertools.cycle(engines)
+
+    def choose(self) -> AsyncEngine:
+        if self.strategy == "least_busy":
+            return min(self.engines, key=_get_checked_out)
+        return next(self._round_robin)
+
+
+replica_selector = ReplicaSelector(replica_engines, settings.DB_REPLICA_SELECTION) if replica_engines else None
+
+
+def get_read_engine() -> AsyncEngine:
+    """Engine for reads that work on a connection directly instead of a session"""
+    return replica_selector.choose() if replica_selector is not None else engine
+
+
+class RoutingSession(Session):
+    """
+    Sends plain SELECTs to a replica and everything else to the primary.
+    Once a session writes (see SQLAlchemyUserDAL), it sets USE_PRIMARY and reads its own writes from the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (
+                replica_selector is None
+                or self._flushing
+                or self.info.get(USE_PRIMARY)
+                or not isinstance(clause, Select)
+        ):
+            return engine.sync_engine
+        return replica_selector.choose().sync_engine
+
+
 async_session = sessionmaker(
     engine,
     expire_on_commit=False,
-    class_=AsyncSession
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
 )
 
 
+def primary_session() -> AsyncSession:
+    """Session that never reads from replicas"""
+    return async_session(info={USE_PRIMARY: True})
+
+
+def reads_from_replica(session: AsyncSession) -> bool:
+    """Whether plain SELECTs of the session go to a replica, which may lag behind the primary"""
+    return replica_selector is not None and not session.info.get(USE_PRIMARY)
+
+
+class LazyAsyncSession:
+    """
+    Stands in for an AsyncSession and creates the real one on first use.
+    Requests that never touch the database create no session and never check out a connection.
+    """
+
+    def __init__(self, session_factory: sessionmaker):
+        self._session_factory = session_factory
+        self._session = None
+
+    def __getattr__(self, name: str):
+        if self._session is None:
+            self._session = self._session_factory()
+        return getattr(self._session, name)
+
+    async def close(self):
+        """Close the real session if one was created, returning its connection to the pool"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
 async def get_async_db() -> Generator:
-    """Dependency for getting async session"""
-    async with async_session() as session:
+    """Dependency for getting async session, created lazily on first use"""
+    session = LazyAsyncSession(async_session)
+    try:
         yield session
+    finally:
+        await session.close()
+
+
+async def warmup_engine(engine: AsyncEngine, connections: int):
+    """Open pool connections ahead of the first requests"""
+    opened = await asyncio.gather(*(engine.connect() for _ in range(connections)))
+    for connection in opened:
+        await connection.close()
+
+
+def get_pool_status(engine: AsyncEngine) -> dict:
+    pool = engine.sync_engine.pool
+    status = {"pool": pool.status()}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedAsyncAdaptedQueuePool):
+        status.update(
+            waiting=pool.wait_stats.waiting,
+            checkouts=pool.wait_stats.checkouts,
+            waits=pool.wait_stats.waits,
+            total_wait_seconds=pool.wait_stats.total_wait_seconds,
+            max_wait_seconds=pool.wait_stats.max_wait_seconds,
+        )
+    return status
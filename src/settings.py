@@ -1,3 +1,5 @@
+import os
+
 from envparse import Env
 
 
@@ -5,12 +7,110 @@ env = Env()
 
 ASYNC_DATABASE_URL = env.str("ASYNC_DATABASE_URL", default="sqlite+aiosqlite:///test_db_sqlite.sqlite")
 APP_PORT = env.int("APP_PORT", default=40610)
+# Comma separated read replica URLs; user lookups are spread over them with DB_REPLICA_SELECTION
+# ("round_robin" or "least_busy"), writes and reads after a write in the same request go to ASYNC_DATABASE_URL.
+# Replica reads bypass the user cache (see USER_CACHE_MAXSIZE)
+ASYNC_DATABASE_REPLICA_URLS: list = env.list("ASYNC_DATABASE_REPLICA_URLS", default=[])
+DB_REPLICA_SELECTION: str = env.str("DB_REPLICA_SELECTION", default="round_robin")
+
+# Database engine and connection pool
+DB_ECHO: bool = env.bool("DB_ECHO", default=False)
+DB_POOL_SIZE: int = env.int("DB_POOL_SIZE", default=10)
+DB_MAX_OVERFLOW: int = env.int("DB_MAX_OVERFLOW", default=20)
+DB_POOL_TIMEOUT_SECONDS: float = env.float("DB_POOL_TIMEOUT_SECONDS", default=30)
+DB_POOL_RECYCLE_SECONDS: int = env.int("DB_POOL_RECYCLE_SECONDS", default=1800)
+DB_POOL_PRE_PING: bool = env.bool("DB_POOL_PRE_PING", default=True)
+DB_WARMUP_CONNECTIONS: int = env.int("DB_WARMUP_CONNECTIONS", default=5)
 
 # AUTH
 AUTH_SECRET_KEY: str = env.str("AUTH_SECRET_KEY", default="secret_key")
 AUTH_ALGORITHM: str = env.str("AUTH_ALGORITHM", default="HS256")
+# RS*/ES* algorithms sign with `<kid>.pem` keys from AUTH_KEYS_DIR
+AUTH_KEYS_DIR: str = env.str("AUTH_KEYS_DIR", default="")
+AUTH_SIGNING_KEY_ID: str = env.str("AUTH_SIGNING_KEY_ID", default="")
+AUTH_JWKS_MAX_AGE_SECONDS: int = env.int("AUTH_JWKS_MAX_AGE_SECONDS", default=300)
 AUTH_ACCESS_TOKEN_EXPIRE_MINUTES: int = env.int("ACCESS_TOKEN_EXPIRE_MINUTES", default=30)
 AUTH_REFRESH_TOKEN_EXPIRE_MINUTES: int = env.int("REFRESH_TOKEN_EXPIRE_MINUTES", default=4 * 7 * 24 * 60)
+# "stateless" builds the current user from access token claims, "strict" reloads it from the database
+AUTH_TOKEN_VERIFICATION: str = env.str("AUTH_TOKEN_VERIFICATION", default="stateless")
+# Claims of already verified tokens, AUTH_TOKEN_CACHE_MAXSIZE=0 disables the cache
+AUTH_TOKEN_CACHE_MAXSIZE: int = env.int("AUTH_TOKEN_CACHE_MAXSIZE", default=50_000)
+# Refresh token revocation list: "db" is shared by all workers, "local" lives in the process
+AUTH_REVOCATION_BACKEND: str = env.str("AUTH_REVOCATION_BACKEND", default="db")
+AUTH_REVOCATION_BLOOM_CAPACITY: int = env.int("AUTH_REVOCATION_BLOOM_CAPACITY", default=1_000_000)
+AUTH_REVOCATION_BLOOM_ERROR_RATE: float = env.float("AUTH_REVOCATION_BLOOM_ERROR_RATE", default=0.001)
+AUTH_REVOCATION_SYNC_SECONDS: float = env.float("AUTH_REVOCATION_SYNC_SECONDS", default=5)
+# Max tokens per introspection request
+AUTH_INTROSPECTION_MAX_TOKENS: int = env.int("AUTH_INTROSPECTION_MAX_TOKENS", default=500)
+
+# Password hashing pool: "thread" or "process"
+AUTH_HASHER_EXECUTOR: str = env.str("AUTH_HASHER_EXECUTOR", default="thread")
+AUTH_HASHER_MAX_WORKERS: int = env.int("AUTH_HASHER_MAX_WORKERS", default=os.cpu_count() or 1)
+# Workers batch create and import may hold at once, the rest of the pool is left for logins
+AUTH_HASHER_BULK_CONCURRENCY: int = env.int(
+    "AUTH_HASHER_BULK_CONCURRENCY", default=max(1, AUTH_HASHER_MAX_WORKERS // 4)
+)
+
+# Password schemes, the first one hashes new passwords and the others are rehashed on login.
+# AUTH_HASH_COST (bcrypt rounds, argon2 time cost) 0 calibrates it at startup to take about AUTH_HASH_TARGET_MS.
+AUTH_PASSWORD_SCHEMES: list = env.list("AUTH_PASSWORD_SCHEMES", default=["bcrypt"])
+AUTH_HASH_COST: int = env.int("AUTH_HASH_COST", default=0)
+AUTH_HASH_TARGET_MS: float = env.float("AUTH_HASH_TARGET_MS", default=250)
+AUTH_REHASH_ON_LOGIN: bool = env.bool("AUTH_REHASH_ON_LOGIN", default=True)
+
+# Login admission control: concurrent password checks, queue bound and per-IP/per-account limits (0 disables a limit)
+AUTH_LOGIN_MAX_CONCURRENT: int = env.int("AUTH_LOGIN_MAX_CONCURRENT", default=2 * AUTH_HASHER_MAX_WORKERS)
+AUTH_LOGIN_MAX_WAITING: int = env.int("AUTH_LOGIN_MAX_WAITING", default=64)
+AUTH_LOGIN_WAIT_TIMEOUT_SECONDS: float = env.float("AUTH_LOGIN_WAIT_TIMEOUT_SECONDS", default=2)
+AUTH_LOGIN_IP_LIMIT: int = env.int("AUTH_LOGIN_IP_LIMIT", default=30)
+AUTH_LOGIN_ACCOUNT_LIMIT: int = env.int("AUTH_LOGIN_ACCOUNT_LIMIT", default=10)
+AUTH_LOGIN_RATE_WINDOW_SECONDS: float = env.float("AUTH_LOGIN_RATE_WINDOW_SECONDS", default=60)
+AUTH_LOGIN_RATE_MAX_KEYS: int = env.int("AUTH_LOGIN_RATE_MAX_KEYS", default=100_000)
+# Header carrying the client IP set by a trusted reverse proxy (e.g. X-Real-IP), empty uses the socket peer.
+# Behind a proxy without it every client shares the proxy's IP limit
+AUTH_CLIENT_IP_HEADER: str = env.str("AUTH_CLIENT_IP_HEADER", default="")
+
+# In-process cache of user lookups, USER_CACHE_MAXSIZE=0 disables it. Only primary reads fill it:
+# with read replicas configured, lookups served by a replica are not cached.
+# Writes only invalidate the cache of the worker making them: the TTL bounds how long
+# other workers may still serve a changed, deactivated or deleted user
+USER_CACHE_MAXSIZE: int = env.int("USER_CACHE_MAXSIZE", default=10_000)
+USER_CACHE_TTL_SECONDS: float = env.float("USER_CACHE_TTL_SECONDS", default=5)
+# Concurrent identical user lookups (by id, email or username) share one query
+USER_LOOKUP_COALESCING: bool = env.bool("USER_LOOKUP_COALESCING", default=True)
+
+# Bulk user creation: items per request and rows per INSERT statement
+USER_BULK_CREATE_MAX_ITEMS: int = env.int("USER_BULK_CREATE_MAX_ITEMS", default=1000)
+USER_BULK_CREATE_CHUNK_SIZE: int = env.int("USER_BULK_CREATE_CHUNK_SIZE", default=500)
+
+# Max ids, emails or usernames resolved by one batch lookup
+USER_BATCH_LOOKUP_MAX_ITEMS: int = env.int("USER_BATCH_LOOKUP_MAX_ITEMS", default=1000)
+
+# Page size bounds of the user listing
+USER_LIST_DEFAULT_LIMIT: int = env.int("USER_LIST_DEFAULT_LIMIT", default=50)
+USER_LIST_MAX_LIMIT: int = env.int("USER_LIST_MAX_LIMIT", default=500)
+
+# Rows fetched from the server-side cursor and serialized per chunk by the user export
+USER_EXPORT_BATCH_SIZE: int = env.int("USER_EXPORT_BATCH_SIZE", default=2000)
+
+# User import: records upserted per transaction, transactions in flight, rejected records listed in the report
+USER_IMPORT_CHUNK_SIZE: int = env.int("USER_IMPORT_CHUNK_SIZE", default=1000)
+USER_IMPORT_CONCURRENCY: int = env.int("USER_IMPORT_CONCURRENCY", default=4)
+USER_IMPORT_MAX_REPORTED_ERRORS: int = env.int("USER_IMPORT_MAX_REPORTED_ERRORS", default=100)
+
+# Request and stage latency histograms served at /metrics
+METRICS_ENABLED: bool = env.bool("METRICS_ENABLED", default=True)
+
+# Audit log of logins and refreshes: events queued in memory and written in batches by a background task.
+# Recording waits up to AUDIT_ENQUEUE_TIMEOUT_SECONDS for room in a full queue before failing the request with 503
+AUDIT_QUEUE_MAXSIZE: int = env.int("AUDIT_QUEUE_MAXSIZE", default=10_000)
+AUDIT_BATCH_SIZE: int = env.int("AUDIT_BATCH_SIZE", default=500)
+AUDIT_FLUSH_INTERVAL_SECONDS: float = env.float("AUDIT_FLUSH_INTERVAL_SECONDS", default=0.5)
+AUDIT_ENQUEUE_TIMEOUT_SECONDS: float = env.float("AUDIT_ENQUEUE_TIMEOUT_SECONDS", default=2)
+AUDIT_DRAIN_TIMEOUT_SECONDS: float = env.float("AUDIT_DRAIN_TIMEOUT_SECONDS", default=10)
+# Page size bounds of the audit event query
+AUDIT_LIST_DEFAULT_LIMIT: int = env.int("AUDIT_LIST_DEFAULT_LIMIT", default=100)
+AUDIT_LIST_MAX_LIMIT: int = env.int("AUDIT_LIST_MAX_LIMIT", default=1000)
 
 # test envs
 # TEST_DATABASE_URL = env.str(
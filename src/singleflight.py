@@ -0,0 +1,62 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0
+    # Calls served by awaiting the result of an identical call already in flight
+    coalesced: int = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first one runs, calls arriving while it is in flight
+    await its result or exception instead of running their own. Nothing is kept once the call completes.
+    Not thread safe: meant to be used from the event loop only.
+    """
+
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats.calls += 1
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats.coalesced += 1
+            try:
+                # Shielded: cancelling one waiting request must not cancel the result the others share
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # The leading call was cancelled along with its request, this one runs on its own
+            return await func()
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # Retrieved here, so a call nobody joined does not log "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def forget(self, key: Hashable):
+        """Calls arriving after a write should not join a read started before it"""
+        self._in_flight.pop(key, None)
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from typing import Optional
+
+import settings
+from cache import CacheStats
+from cache import TTLCache
+from singleflight import SingleFlight
+
+from .schemas import UserDTO
+
+
+class UserCache:
+    """
+    In-process cache of UserDTO lookups.
+    Users are stored by id, emails and usernames are aliases resolving to the id,
+    so invalidating a user id drops every way of reaching its entry.
+
+    Every invalidation bumps `epoch` and stamps the keys it drops with it. A lookup passes the epoch it saw
+    before its SELECT to set(), and a row read before a write to the same user is not cached.
+    Invalidation is per process: other workers may serve the old row for up to the TTL.
+
+    Only rows read from the primary are cached. A lagging replica can return a row older than a write
+    the cache was already invalidated for, so with ASYNC_DATABASE_REPLICA_URLS set, lookups of plain
+    request sessions are spread over the replicas and the cache only fills from primary reads.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.stats = CacheStats()
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._aliases = TTLCache(maxsize=maxsize * 2, ttl=ttl)
+        self.epoch = 0
+        # Epoch of the last invalidation per key, oldest first. Keys dropped for room raise the floor,
+        # which then stands in for any key without a stamp
+        self._invalidated: OrderedDict = OrderedDict()
+        self._invalidated_floor = 0
+        self._max_invalidated = maxsize * 2
+
+    @property
+    def enabled(self) -> bool:
+        return self._users.maxsize > 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def get(self, field: str, value) -> Optional[UserDTO]:
+        if field == "user_id":
+            user = self._users.get(value)
+        else:
+            user_id = self._aliases.get((field, value))
+            user = self._users.get(user_id) if user_id is not None else None
+            if user is not None and getattr(user, field) != value:
+                user = None
+        if user is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return user
+
+    def _invalidated_since(self, key, epoch: int) -> bool:
+        return self._invalidated.get(key, self._invalidated_floor) > epoch
+
+    def _stamp(self, key):
+        self._invalidated[key] = self.epoch
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self._max_invalidated:
+            _, stamp = self._invalidated.popitem(last=False)
+            self._invalidated_floor = max(self._invalidated_floor, stamp)
+
+    def set(self, user: UserDTO, read_epoch: int):
+        """read_epoch is the epoch seen before the row was read"""
+        if not self.enabled:
+            return
+        keys = (("user_id", user.user_id), ("email", user.email), ("username", user.username))
+        if any(self._invalidated_since(key, read_epoch) for key in keys):
+            return
+        self._users.set(user.user_id, user)
+        self._aliases.set(("email", user.email), user.user_id)
+        self._aliases.set(("username", user.username), user.user_id)
+
+    def invalidate(self, user_id: Optional[int] = None, email: Optional[str] = None,
+                   username: Optional[str] = None):
+        self.epoch += 1
+        if user_id is not None:
+            self._users.pop(user_id)
+            self._stamp(("user_id", user_id))
+        if email is not None:
+            self._aliases.pop(("email", email))
+            self._stamp(("email", email))
+        if username is not None:
+            self._aliases.pop(("username", username))
+            self._stamp(("username", username))
+
+    def clear(self):
+        self._users.clear()
+        self._aliases.clear()
+        # Lookups in flight must not refill the cache either
+        self.epoch += 1
+        self._invalidated.clear()
+        self._invalidated_floor = self.epoch
+
+
+user_cache = UserCache(
+    maxsize=settings.USER_CACHE_MAXSIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+)
+
+# Database lookups of users in flight, concurrent identical lookups await the same query
+user_lookups = SingleFlight()
@@ -1,15 +1,60 @@
 from abc import ABCMeta, abstractmethod
-from typing import Union, Optional
+from typing import List, Union, Optional
 
 from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import func
 from sqlalchemy import select
 from sqlalchemy import update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import settings
+from metrics import STAGE_DB
+from metrics import observe_stage
+from metrics import timed_stage
+from session import USE_PRIMARY
+from session import reads_from_replica
+from .cache import UserCache
+from .cache import user_cache
+from .cache import user_lookups
 from .models import User
 from .schemas import UserDTO
+from .schemas import UserListItem
 from .schemas import UserRole
 
+INSERT_BY_DIALECT = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Lookups select plain columns of the table: rows skip ORM entity hydration and the statements
+# are built once, so their compiled form is reused from the engine cache
+_user_table = User.__table__
+_USER_COLUMNS = [_user_table.c[field] for field in UserDTO.model_fields]
+_SELECT_USER_BY = {
+    field: select(*_USER_COLUMNS).where(_user_table.c[field] == bindparam("value"))
+    for field in ("user_id", "email", "username")
+}
+_SELECT_USERS_BY = {
+    field: select(*_USER_COLUMNS).where(_user_table.c[field].in_(bindparam("values", expanding=True)))
+    for field in ("user_id", "email", "username")
+}
+# Matches ix_user_active_lower_email: the predicates must stay identical to the index expression and condition
+_SELECT_ACTIVE_USER_BY_LOWER_EMAIL = (
+    select(*_USER_COLUMNS)
+    .where(func.lower(_user_table.c.email) == func.lower(bindparam("value")), _user_table.c.is_active == True)
+    # Legacy rows may differ only in case, the exact spelling wins
+    .order_by((_user_table.c.email == bindparam("value")).desc(), _user_table.c.user_id)
+    .limit(1)
+)
+_LIST_USER_COLUMNS = [_user_table.c[field] for field in UserListItem.model_fields]
+
+
+def _user_from_row(row) -> UserDTO:
+    return UserDTO.model_construct(**row._mapping)
+
 
 class AbstractUserDAL(metaclass=ABCMeta):
     @abstractmethod
@@ -26,6 +71,10 @@ class AbstractUserDAL(metaclass=ABCMeta):
     ) -> UserDTO:
         pass
 
+    @abstractmethod
+    def create_users(self, users) -> List[UserDTO]:
+        pass
+
     @abstractmethod
     def delete_user(self, user_id) -> Optional[int]:
         pass
@@ -38,17 +87,109 @@ class AbstractUserDAL(metaclass=ABCMeta):
     def get_user_by_email(self, email) -> Optional[UserDTO]:
         pass
 
+    @abstractmethod
+    def get_active_user_by_email(self, email) -> Optional[UserDTO]:
+        pass
+
+    @abstractmethod
+    def get_users_by_ids(self, user_ids) -> List[UserDTO]:
+        pass
+
+    @abstractmethod
+    def get_users_by_emails(self, emails) -> List[UserDTO]:
+        pass
+
+    @abstractmethod
+    def upsert_users(self, users, updatable_roles) -> List[UserDTO]:
+        pass
+
+    @abstractmethod
+    def list_users(self, limit, after_user_id, role, is_active) -> List[UserListItem]:
+        pass
+
     @abstractmethod
     def update_user(self, user_id, kwargs) -> Optional[UserDTO]:
         pass
 
+    @abstractmethod
+    def update_password_hash(self, user_id, old_hash, new_hash) -> bool:
+        pass
+
 
 class SQLAlchemyUserDAL(AbstractUserDAL):
     """Data Access Layer for operating user info"""
 
-    def __init__(self, db_session: AsyncSession):
+    def __init__(self, db_session: AsyncSession, cache: Optional[UserCache] = user_cache):
         self.db_session = db_session
+        self.cache = cache
+
+    def _invalidate(self, user_id: Optional[int] = None, email: Optional[str] = None,
+                    username: Optional[str] = None):
+        if self.cache is not None:
+            self.cache.invalidate(user_id=user_id, email=email, username=username)
+        for key in (("user_id", user_id), ("email", email), ("active_email", email), ("username", username)):
+            if key[1] is not None:
+                user_lookups.forget(key)
+
+    def _use_primary(self):
+        """Route the rest of the session to the primary so it reads its own writes"""
+        self.db_session.info[USE_PRIMARY] = True
+
+    def _cache_users(self, users: List[UserDTO], read_epoch: int):
+        """Rows read from a replica are not cached, they may predate a write the cache was invalidated for"""
+        if self.cache is None or reads_from_replica(self.db_session):
+            return
+        for user in users:
+            self.cache.set(user, read_epoch)
 
+    async def _coalesce(self, key: tuple, fetch):
+        """
+        Identical lookups of concurrent requests share one query. Not for DALs bypassing the cache,
+        which want a fresh read, nor for sessions on the primary, which read their own writes.
+        """
+        if self.cache is None or not settings.USER_LOOKUP_COALESCING or self.db_session.info.get(USE_PRIMARY):
+            return await fetch()
+        return await user_lookups.do(key, fetch)
+
+    async def _get_user_by(self, field: str, value) -> Optional[UserDTO]:
+        if self.cache is not None:
+            user = self.cache.get(field, value)
+            if user is not None:
+                return user
+        return await self._coalesce((field, value), lambda: self._fetch_user(_SELECT_USER_BY[field], value))
+
+    @timed_stage(STAGE_DB)
+    async def _fetch_user(self, query, value) -> Optional[UserDTO]:
+        """The query behind a lookup the cache could not answer, timed as the db stage unlike cache hits"""
+        read_epoch = self.cache.epoch if self.cache is not None else 0
+        res = await self.db_session.execute(query, {"value": value})
+        user_row = res.fetchone()
+        if user_row is not None:
+            user = _user_from_row(user_row)
+            self._cache_users([user], read_epoch)
+            return user
+
+    async def _get_users_by(self, field: str, values: List) -> List[UserDTO]:
+        """Resolve many users with a single IN query, keeping the order of values"""
+        found = {}
+        missing = []
+        for value in dict.fromkeys(values):
+            user = self.cache.get(field, value) if self.cache is not None else None
+            if user is None:
+                missing.append(value)
+            else:
+                found[value] = user
+        if missing:
+            read_epoch = self.cache.epoch if self.cache is not None else 0
+            with observe_stage(STAGE_DB):
+                res = await self.db_session.execute(_SELECT_USERS_BY[field], {"values": missing})
+                users = [_user_from_row(user_row) for user_row in res.fetchall()]
+            self._cache_users(users, read_epoch)
+            for user in users:
+                found[getattr(user, field)] = user
+        return [found[value] for value in values if value in found]
+
+    @timed_stage(STAGE_DB)
     async def create_user(
             self,
             username: str,
@@ -56,6 +197,7 @@ class SQLAlchemyUserDAL(AbstractUserDAL):
             hashed_password: str,
             role: UserRole,
     ) -> UserDTO:
+        self._use_primary()
         new_user = User(
             username=username,
             email=email,
@@ -64,9 +206,56 @@ class SQLAlchemyUserDAL(AbstractUserDAL):
         )
         self.db_session.add(new_user)
         await self.db_session.flush()
+        self._invalidate(user_id=new_user.user_id, email=email, username=username)
         return UserDTO.model_validate(new_user)
 
+    @timed_stage(STAGE_DB)
+    async def create_users(self, users: List[dict]) -> List[UserDTO]:
+        """
+        Insert many users with one multi-row INSERT.
+        Rows conflicting with existing usernames or emails are skipped, only created users are returned.
+        """
+        self._use_primary()
+        insert = INSERT_BY_DIALECT[self.db_session.get_bind().dialect.name]
+        query = (
+            insert(User)
+            .values([{"is_active": True, **user} for user in users])
+            .on_conflict_do_nothing()
+            .returning(*_USER_COLUMNS)
+        )
+        res = await self.db_session.execute(query)
+        created_users = [_user_from_row(row) for row in res.fetchall()]
+        for user in created_users:
+            self._invalidate(user_id=user.user_id, email=user.email, username=user.username)
+        return created_users
+
+    @timed_stage(STAGE_DB)
+    async def upsert_users(self, users: List[dict], updatable_roles: List[int]) -> List[UserDTO]:
+        """
+        Insert many users with one multi-row INSERT, existing users with the same email and one of
+        updatable_roles get the new password and status, others are left alone and not returned.
+        Emails should be unique within the batch.
+        """
+        self._use_primary()
+        insert = INSERT_BY_DIALECT[self.db_session.get_bind().dialect.name]
+        query = insert(User).values(users)
+        query = query.on_conflict_do_update(
+            index_elements=[User.email],
+            set_={
+                "hashed_password": query.excluded.hashed_password,
+                "is_active": query.excluded.is_active,
+            },
+            where=User.role.in_(updatable_roles),
+        ).returning(*_USER_COLUMNS)
+        res = await self.db_session.execute(query)
+        upserted_users = [_user_from_row(row) for row in res.fetchall()]
+        for user in upserted_users:
+            self._invalidate(user_id=user.user_id, email=user.email, username=user.username)
+        return upserted_users
+
+    @timed_stage(STAGE_DB)
     async def delete_user(self, user_id: int) -> Optional[int]:
+        self._use_primary()
         query = (
             update(User)
             .where(and_(User.user_id == user_id, User.is_active == True))
@@ -74,32 +263,61 @@ class SQLAlchemyUserDAL(AbstractUserDAL):
             .returning(User.user_id)
         )
         res = await self.db_session.execute(query)
+        self._invalidate(user_id=user_id)
         deleted_user_id_row = res.fetchone()
         if deleted_user_id_row is not None:
             return deleted_user_id_row[0]
 
     async def get_user_by_id(self, user_id: int) -> Optional[UserDTO]:
-        query = select(User).where(User.user_id == user_id)
-        res = await self.db_session.execute(query)
-        user_row = res.fetchone()
-        if user_row is not None:
-            return UserDTO.model_validate(user_row[0])
+        return await self._get_user_by("user_id", user_id)
 
     async def get_user_by_email(self, email: str) -> Optional[UserDTO]:
-        query = select(User).where(User.email == email)
-        res = await self.db_session.execute(query)
-        user_row = res.fetchone()
-        if user_row is not None:
-            return UserDTO.model_validate(user_row[0])
+        return await self._get_user_by("email", email)
+
+    async def get_active_user_by_email(self, email: str) -> Optional[UserDTO]:
+        """Login lookup: email compared case-insensitively, inactive users are not found"""
+        if self.cache is not None:
+            user = self.cache.get("email", email)
+            if user is not None and user.is_active:
+                return user
+        return await self._coalesce(
+            ("active_email", email), lambda: self._fetch_user(_SELECT_ACTIVE_USER_BY_LOWER_EMAIL, email)
+        )
 
     async def get_user_by_username(self, username: str) -> Optional[UserDTO]:
-        query = select(User).where(User.username == username)
+        return await self._get_user_by("username", username)
+
+    async def get_users_by_ids(self, user_ids: List[int]) -> List[UserDTO]:
+        return await self._get_users_by("user_id", user_ids)
+
+    async def get_users_by_emails(self, emails: List[str]) -> List[UserDTO]:
+        return await self._get_users_by("email", emails)
+
+    async def get_users_by_usernames(self, usernames: List[str]) -> List[UserDTO]:
+        return await self._get_users_by("username", usernames)
+
+    @timed_stage(STAGE_DB)
+    async def list_users(
+            self,
+            limit: int,
+            after_user_id: Optional[int] = None,
+            role: Optional[int] = None,
+            is_active: Optional[bool] = None,
+    ) -> List[UserListItem]:
+        """Keyset page ordered by user_id: seeks past after_user_id instead of skipping rows with OFFSET"""
+        query = select(*_LIST_USER_COLUMNS).order_by(_user_table.c.user_id).limit(limit)
+        if after_user_id is not None:
+            query = query.where(_user_table.c.user_id > after_user_id)
+        if role is not None:
+            query = query.where(_user_table.c.role == role)
+        if is_active is not None:
+            query = query.where(_user_table.c.is_active == is_active)
         res = await self.db_session.execute(query)
-        user_row = res.fetchone()
-        if user_row is not None:
-            return UserDTO.model_validate(user_row[0])
+        return [UserListItem.model_construct(**row._mapping) for row in res.fetchall()]
 
+    @timed_stage(STAGE_DB)
     async def update_user(self, user_id: int, **kwargs) -> Union[int, None]:
+        self._use_primary()
         query = (
             update(User)
             .where(and_(User.user_id == user_id, User.is_active == True))
@@ -107,6 +325,30 @@ class SQLAlchemyUserDAL(AbstractUserDAL):
             .returning(User.user_id)
         )
         res = await self.db_session.execute(query)
+        self._invalidate(user_id=user_id)
         update_user_id_row = res.fetchone()
         if update_user_id_row is not None:
-            return UserDTO.model_validate(update_user_id_row[0])
+            return update_user_id_row[0]
+
+    @timed_stage(STAGE_DB)
+    async def update_password_hash(self, user_id: int, old_hash: str, new_hash: str) -> bool:
+        """Replace the hash only if it is still old_hash, so a concurrent password change wins"""
+        self._use_primary()
+        query = (
+            update(User)
+            .where(and_(User.user_id == user_id, User.hashed_password == old_hash))
+            .values(hashed_password=new_hash)
+            .returning(User.user_id)
+        )
+        res = await self.db_session.execute(query)
+        self._invalidate(user_id=user_id)
+        return res.fetchone() is not None
+
+
+async def warmup_user_queries(session: AsyncSession):
+    """Run the hot user lookups once so their compiled SQL is cached before traffic arrives"""
+    user_dal = SQLAlchemyUserDAL(session, cache=None)
+    await user_dal.get_user_by_id(0)
+    await user_dal.get_user_by_email("")
+    await user_dal.get_active_user_by_email("")
+    await user_dal.get_user_by_username("")
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Callable, Dict, Sequence
+
+from sqlalchemy import Row
+from sqlalchemy import select
+
+from session import get_read_engine
+from .models import User
+
+# hashed_password is never exported
+EXPORT_FIELDS = ("user_id", "username", "email", "is_active", "role")
+
+_user_table = User.__table__
+_EXPORT_QUERY = select(*(_user_table.c[field] for field in EXPORT_FIELDS)).order_by(_user_table.c.user_id)
+
+# asyncpg opens server-side cursors only inside a transaction, the engine runs in AUTOCOMMIT.
+# REPEATABLE READ also makes the whole export one consistent snapshot.
+_SNAPSHOT_ISOLATION_LEVELS = {"postgresql": "REPEATABLE READ"}
+
+# json.dumps with non-default separators builds a new encoder per call
+_encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+
+async def stream_user_rows(batch_size: int) -> AsyncIterator[Sequence[Row]]:
+    """Yield users ordered by id in partitions of batch_size rows, read through a server-side cursor"""
+    async with get_read_engine().connect() as connection:
+        isolation_level = _SNAPSHOT_ISOLATION_LEVELS.get(connection.dialect.name)
+        if isolation_level is not None:
+            await connection.execution_options(isolation_level=isolation_level)
+        async with connection.begin():
+            result = await connection.stream(_EXPORT_QUERY.execution_options(yield_per=batch_size))
+            async for partition in result.partitions():
+                yield partition
+
+
+def _ndjson_header() -> str:
+    return ""
+
+
+def _ndjson_chunk(rows: Sequence[Row]) -> str:
+    return "".join(_encode_json(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in rows)
+
+
+def _csv_header() -> str:
+    return ",".join(EXPORT_FIELDS) + "\r\n"
+
+
+def _csv_chunk(rows: Sequence[Row]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+class ExportFormat:
+    def __init__(self, media_type: str, header: Callable[[], str], chunk: Callable[[Sequence[Row]], str]):
+        self.media_type = media_type
+        self.header = header
+        self.chunk = chunk
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    "ndjson": ExportFormat("application/x-ndjson", _ndjson_header, _ndjson_chunk),
+    "csv": ExportFormat("text/csv", _csv_header, _csv_chunk),
+}
+
+
+async def export_users(export_format: str, batch_size: int) -> AsyncIterator[str]:
+    """Serialized export, one text chunk per cursor partition so memory stays bounded by batch_size"""
+    serializer = EXPORT_FORMATS[export_format]
+    header = serializer.header()
+    if header:
+        yield header
+    async for rows in stream_user_rows(batch_size):
+        yield serializer.chunk(rows)
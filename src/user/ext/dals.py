@@ -0,0 +1,96 @@
+import uuid
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import STAGE_DB
+from metrics import timed_stage
+from user.schemas import UserRole
+from .models.model import User
+from .models.model import has_role
+from .models.model import roles_to_bits
+
+
+class MultiRoleUserDAL:
+    """Data Access Layer for users of the multi-role model"""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    @timed_stage(STAGE_DB)
+    async def create_user(
+            self,
+            username: str,
+            email: str,
+            hashed_password: str,
+            roles: Iterable[UserRole] = (UserRole.ROLE_USER,),
+            name: Optional[str] = None,
+            surname: Optional[str] = None,
+    ) -> User:
+        new_user = User(
+            username=username,
+            email=email,
+            hashed_password=hashed_password,
+            roles=roles_to_bits(roles),
+            name=name,
+            surname=surname,
+        )
+        self.db_session.add(new_user)
+        await self.db_session.flush()
+        return new_user
+
+    @timed_stage(STAGE_DB)
+    async def get_user_by_id(self, user_id: uuid.UUID) -> Optional[User]:
+        res = await self.db_session.execute(select(User).where(User.user_id == user_id))
+        return res.scalar_one_or_none()
+
+    @timed_stage(STAGE_DB)
+    async def list_users_with_roles(
+            self,
+            roles: Iterable[UserRole],
+            limit: int,
+            after_user_id: Optional[uuid.UUID] = None,
+            match_all: bool = False,
+    ) -> List[User]:
+        """
+        Keyset page ordered by user_id of users holding any (or with match_all, every) of roles.
+        One predicate per role rather than a single mask test, so each can use its partial index.
+        """
+        predicates = [has_role(role) for role in roles]
+        if not predicates:
+            return []
+        query = (
+            select(User)
+            .where(and_(*predicates) if match_all else or_(*predicates))
+            .order_by(User.user_id)
+            .limit(limit)
+        )
+        if after_user_id is not None:
+            query = query.where(User.user_id > after_user_id)
+        res = await self.db_session.execute(query)
+        return list(res.scalars())
+
+    @timed_stage(STAGE_DB)
+    async def add_roles(self, user_id: uuid.UUID, roles: Iterable[UserRole]) -> Optional[int]:
+        """Set the role bits in one atomic UPDATE, returns the new bitset or None for an unknown user"""
+        return await self._update_roles(user_id, User.roles.bitwise_or(roles_to_bits(roles)))
+
+    @timed_stage(STAGE_DB)
+    async def remove_roles(self, user_id: uuid.UUID, roles: Iterable[UserRole]) -> Optional[int]:
+        """Clear the role bits in one atomic UPDATE, returns the new bitset or None for an unknown user"""
+        return await self._update_roles(user_id, User.roles.bitwise_and(~roles_to_bits(roles)))
+
+    async def _update_roles(self, user_id: uuid.UUID, roles) -> Optional[int]:
+        query = (
+            update(User)
+            .where(User.user_id == user_id)
+            .values(roles=roles)
+            .returning(User.roles)
+            .execution_options(synchronize_session=False)
+        )
+        res = await self.db_session.execute(query)
+        return res.scalar_one_or_none()
@@ -1,11 +1,14 @@
 
 import uuid
+from typing import Iterable, Set
 
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Index
+from sqlalchemy import Integer
 from sqlalchemy import String
-from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Uuid
+from sqlalchemy import literal_column
 from sqlalchemy.orm import declarative_base
 
 from user.schemas import UserRole
@@ -13,35 +16,74 @@ from user.schemas import UserRole
 Base = declarative_base()
 
 
+def role_bit(role: int) -> int:
+    return 1 << role
+
+
+def roles_to_bits(roles: Iterable[int]) -> int:
+    bits = 0
+    for role in roles:
+        bits |= role_bit(role)
+    return bits
+
+
+def bits_to_roles(bits: int) -> Set[UserRole]:
+    return {role for role in UserRole if bits & role_bit(role)}
+
+
 class User(Base):
     """
     The model needs for multiple roles.
-    Only Postgresql supports the function.
+    Roles are stored as a bitset, bit 1 << role is set for every role held,
+    so it runs on any database and a membership test is a single AND.
     """
     __tablename__ = "users"
 
-    user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     username = Column(String, nullable=False, unique=True)
     name = Column(String)
     surname = Column(String)
     email = Column(String, nullable=False, unique=True)
     is_active = Column(Boolean(), default=True)
     hashed_password = Column(String, nullable=False)
-    roles = Column(ARRAY(String), nullable=False)
+    roles = Column(Integer, nullable=False, default=role_bit(UserRole.ROLE_USER))
+
+    def has_role(self, role: int) -> bool:
+        return bool(self.roles & role_bit(role))
 
     @property
     def is_superadmin(self) -> bool:
-        return UserRole.ROLE_SUPERADMIN in self.roles
+        return self.has_role(UserRole.ROLE_SUPERADMIN)
 
     @property
     def is_admin(self) -> bool:
-        return UserRole.ROLE_ADMIN in self.roles
+        return self.has_role(UserRole.ROLE_ADMIN)
 
     def enrich_admin_roles_by_admin_role(self):
         if not self.is_admin:
-            return {*self.roles, UserRole.ROLE_ADMIN}
+            return self.roles | role_bit(UserRole.ROLE_ADMIN)
 
     def remove_admin_privileges_from_model(self):
         if self.is_admin:
-            return {role for role in self.roles if role != UserRole.ROLE_ADMIN}
+            return self.roles & ~role_bit(UserRole.ROLE_ADMIN)
+
+
+def has_role(role: int):
+    """
+    SQL predicate `(roles & bit) != 0`. Constants are rendered inline, not bound:
+    the planners only use a partial index when the query repeats its predicate literally.
+    """
+    return User.roles.bitwise_and(literal_column(str(role_bit(role)))) != literal_column("0")
+
+
+# Privileged roles are rare: a partial index per role keeps "all admins" a short index scan in user_id order.
+# Regular users are nearly every row, a full scan is the best plan for them.
+INDEXED_ROLES = (UserRole.ROLE_SUPERADMIN, UserRole.ROLE_ADMIN)
 
+for _role in INDEXED_ROLES:
+    Index(
+        f"ix_users_{_role.name.lower()}_user_id",
+        User.user_id,
+        postgresql_where=has_role(_role),
+        sqlite_where=has_role(_role),
+    )
@@ -0,0 +1,223 @@
+import asyncio
+import bisect
+import codecs
+import csv
+import json
+from dataclasses import dataclass
+from dataclasses import field
+from operator import attrgetter
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from auth import Hasher
+from auth import async_hasher
+from session import primary_session
+from .dals import SQLAlchemyUserDAL as UserDAL
+from .schemas import UserImportError
+from .schemas import UserImportRecord
+from .schemas import UserImportReport
+from .schemas import UserRole
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines, holding at most one chunk and one partial line"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _parse_ndjson(line: str, fieldnames: Optional[List[str]]) -> dict:
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Record should be a JSON object")
+    return record
+
+
+def _parse_csv(line: str, fieldnames: Optional[List[str]]) -> dict:
+    """One record per line, quoted values spanning several lines are not supported"""
+    values = next(csv.reader([line]))
+    if len(values) != len(fieldnames):
+        raise ValueError(f"Expected {len(fieldnames)} columns, got {len(values)}")
+    # Empty cells are missing values, so one file may mix password and hashed_password rows
+    return {name: value for name, value in zip(fieldnames, values) if value != ""}
+
+
+IMPORT_PARSERS: Dict[str, Callable[[str, Optional[List[str]]], dict]] = {
+    "ndjson": _parse_ndjson,
+    "csv": _parse_csv,
+}
+
+
+def _describe(err: ValueError) -> str:
+    if isinstance(err, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, error['loc'])) or 'record'}: {error['msg']}" for error in err.errors()
+        )
+    return str(err)
+
+
+@dataclass
+class _Chunk:
+    """Records first_record..last_record of the input, the valid ones are in records"""
+    first_record: int
+    last_record: int
+    records: List[Tuple[int, UserImportRecord]] = field(default_factory=list)
+
+
+class UserImporter:
+    """
+    Streams NDJSON or CSV records into the user table.
+
+    Records are parsed and validated as they arrive and upserted by email in chunks of chunk_size,
+    up to `concurrency` chunk transactions at once. Hashes from the legacy store are stored as-is,
+    plain passwords are hashed on the bulk share of the hasher pool. Imported users get the regular user role.
+
+    report.records_done only advances over fully processed chunks. After a failure the import resumes
+    by skipping that many records: upserts are idempotent, so replaying a chunk is harmless.
+    """
+
+    def __init__(self, chunk_size: int, concurrency: int, max_reported_errors: int,
+                 on_checkpoint: Optional[Callable[[int], None]] = None):
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.max_reported_errors = max_reported_errors
+        self.on_checkpoint = on_checkpoint
+        self.report = UserImportReport()
+        self._completed: Dict[int, int] = {}
+
+    async def run(self, lines: AsyncIterator[str], import_format: str, skip: int = 0) -> UserImportReport:
+        self.report.records_done = skip
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        workers = [asyncio.create_task(self._work(queue)) for _ in range(self.concurrency)]
+        try:
+            await self._produce(lines, IMPORT_PARSERS[import_format], import_format == "csv", skip, queue)
+        except UnicodeDecodeError as err:
+            self.report.error = f"Input is not valid UTF-8: {err}"
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        return self.report
+
+    async def _produce(self, lines: AsyncIterator[str], parse: Callable, has_header: bool, skip: int,
+                       queue: asyncio.Queue):
+        fieldnames = None
+        record_number = 0
+        chunk = _Chunk(first_record=skip + 1, last_record=skip)
+        async for line in lines:
+            if self.report.error is not None:
+                return
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            if has_header and fieldnames is None:
+                fieldnames = next(csv.reader([line]))
+                continue
+            record_number += 1
+            if record_number <= skip:
+                continue
+            self.report.records += 1
+            chunk.last_record = record_number
+            try:
+                record = UserImportRecord.model_validate(parse(line, fieldnames))
+                if record.hashed_password is not None and not Hasher.is_password_hash(record.hashed_password):
+                    raise ValueError("hashed_password is not a supported password hash")
+            except ValueError as err:
+                self._reject(record_number, _describe(err))
+                continue
+            chunk.records.append((record_number, record))
+            if len(chunk.records) >= self.chunk_size:
+                await queue.put(chunk)
+                chunk = _Chunk(first_record=record_number + 1, last_record=record_number)
+        if chunk.last_record >= chunk.first_record:
+            await queue.put(chunk)
+
+    async def _work(self, queue: asyncio.Queue):
+        while (chunk := await queue.get()) is not None:
+            if self.report.error is not None:
+                continue
+            try:
+                await self._import_chunk(chunk)
+            except (SQLAlchemyError, OSError) as err:
+                self.report.error = f"Records {chunk.first_record}-{chunk.last_record} failed: {err}"
+                continue
+            self._complete(chunk)
+
+    def _reject(self, record_number: int, detail: str):
+        """Chunks finish out of order: errors are kept sorted, reporting the first max_reported_errors records"""
+        self.report.rejected += 1
+        errors = self.report.errors
+        if len(errors) >= self.max_reported_errors and (not errors or errors[-1].record < record_number):
+            return
+        bisect.insort(errors, UserImportError(record=record_number, detail=detail), key=attrgetter("record"))
+        if len(errors) > self.max_reported_errors:
+            errors.pop()
+
+    def _complete(self, chunk: _Chunk):
+        self._completed[chunk.first_record] = chunk.last_record
+        records_done = self.report.records_done
+        while records_done + 1 in self._completed:
+            records_done = self._completed.pop(records_done + 1)
+        if records_done != self.report.records_done:
+            self.report.records_done = records_done
+            if self.on_checkpoint is not None:
+                self.on_checkpoint(records_done)
+
+    def _deduplicate(self, chunk: _Chunk) -> List[Tuple[int, UserImportRecord]]:
+        """A multi-row upsert cannot touch one row twice, repeated emails or usernames of a chunk are rejected"""
+        emails, usernames, records = set(), set(), []
+        for record_number, record in chunk.records:
+            if record.email in emails or record.username in usernames:
+                self._reject(record_number, "Email or username repeats an earlier record of the same chunk")
+                continue
+            emails.add(record.email)
+            usernames.add(record.username)
+            records.append((record_number, record))
+        return records
+
+    @staticmethod
+    async def _hash(record: UserImportRecord) -> str:
+        if record.hashed_password is not None:
+            return record.hashed_password
+        return await async_hasher.get_password_hash_bulk(record.password)
+
+    async def _import_chunk(self, chunk: _Chunk):
+        records = self._deduplicate(chunk)
+        hashed_passwords = await asyncio.gather(*(self._hash(record) for _, record in records))
+        async with primary_session() as session:
+            async with session.begin():
+                # Read past the user cache: a stale entry would reject a free username
+                taken = await UserDAL(session, cache=None).get_users_by_usernames(
+                    [record.username for _, record in records]
+                )
+                email_by_username = {user.username: user.email for user in taken}
+                rows, row_records = [], []
+                for (record_number, record), hashed_password in zip(records, hashed_passwords):
+                    if email_by_username.get(record.username, record.email) != record.email:
+                        self._reject(record_number, "Username belongs to a user with another email")
+                        continue
+                    row_records.append(record_number)
+                    rows.append({
+                        "username": record.username,
+                        "email": record.email,
+                        "hashed_password": hashed_password,
+                        "is_active": record.is_active,
+                        "role": UserRole.ROLE_USER,
+                    })
+                # Accounts with privileges are never overwritten by an import
+                user_dal = UserDAL(session)
+                upserted = await user_dal.upsert_users(rows, updatable_roles=[UserRole.ROLE_USER]) if rows else []
+        upserted_emails = {user.email for user in upserted}
+        for record_number, row in zip(row_records, rows):
+            if row["email"] not in upserted_emails:
+                self._reject(record_number, "Email belongs to an account the import cannot modify")
+        self.report.upserted += len(upserted)
@@ -1,7 +1,9 @@
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import func
 from sqlalchemy.orm import declarative_base
 
 from .schemas import UserRole
@@ -11,6 +13,11 @@ Base = declarative_base()
 
 class User(Base):
     __tablename__ = "user"
+    __table_args__ = (
+        # Keyset listing: seek on user_id within a role / activity filter, covering the listed columns on Postgres
+        Index("ix_user_role_user_id", "role", "user_id", postgresql_include=["username", "email", "is_active"]),
+        Index("ix_user_is_active_user_id", "is_active", "user_id", postgresql_include=["username", "email", "role"]),
+    )
 
     user_id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String, nullable=False, unique=True)
@@ -36,4 +43,11 @@ class User(Base):
             self.role = UserRole.ROLE_USER
 
 
-
+# Login: case-insensitive email of active users only, covering the whole UserDTO projection on Postgres
+Index(
+    "ix_user_active_lower_email",
+    func.lower(User.email),
+    postgresql_include=["user_id", "username", "email", "is_active", "role", "hashed_password"],
+    postgresql_where=User.is_active == True,
+    sqlite_where=User.is_active == True,
+)
@@ -1,11 +1,15 @@
 import re
 from enum import Enum
-from typing import Optional
+from typing import List, Literal, Optional, Union
 
 from fastapi import HTTPException
 from pydantic import BaseModel
 from pydantic import EmailStr
+from pydantic import Field
 from pydantic import field_validator
+from pydantic import model_validator
+
+import settings
 
 LETTER_MATCH_PATTERN = re.compile(r"^[а-яА-Яa-zA-Z\-]+$")
 
@@ -48,6 +52,89 @@ class UserCreate(BaseModel):
     password: str
 
 
+class BulkUserCreate(BaseModel):
+    users: List[UserCreate] = Field(min_length=1, max_length=settings.USER_BULK_CREATE_MAX_ITEMS)
+
+
+class BulkUserCreateResult(BaseModel):
+    index: int
+    status: Literal["created", "conflict"]
+    user: Optional[ShowUser] = None
+
+
+class BulkUserCreateResponse(BaseModel):
+    created: int
+    conflicts: int
+    results: List[BulkUserCreateResult]
+
+
+class UserBatchLookup(BaseModel):
+    """Exactly one of the lists should be provided"""
+    user_ids: Optional[List[int]] = Field(default=None, max_length=settings.USER_BATCH_LOOKUP_MAX_ITEMS)
+    emails: Optional[List[str]] = Field(default=None, max_length=settings.USER_BATCH_LOOKUP_MAX_ITEMS)
+    usernames: Optional[List[str]] = Field(default=None, max_length=settings.USER_BATCH_LOOKUP_MAX_ITEMS)
+
+    @model_validator(mode="after")
+    def validate_single_lookup_field(self):
+        provided = [values for values in (self.user_ids, self.emails, self.usernames) if values is not None]
+        if len(provided) != 1:
+            raise ValueError("Exactly one of user_ids, emails or usernames should be provided")
+        return self
+
+    @property
+    def lookup(self) -> tuple:
+        if self.user_ids is not None:
+            return "user_id", self.user_ids
+        if self.emails is not None:
+            return "email", self.emails
+        return "username", self.usernames
+
+
+class UserBatchLookupResponse(BaseModel):
+    users: List[ShowUser]
+    missing: List[Union[int, str]]
+
+
+class UserImportRecord(BaseModel):
+    """One imported user: either a plain password or a hash from the legacy store"""
+    username: str
+    email: EmailStr
+    password: Optional[str] = None
+    hashed_password: Optional[str] = None
+    is_active: bool = True
+
+    @model_validator(mode="after")
+    def validate_single_password_field(self):
+        if (self.password is None) == (self.hashed_password is None):
+            raise ValueError("Exactly one of password or hashed_password should be provided")
+        return self
+
+
+class UserImportError(BaseModel):
+    record: int
+    detail: str
+
+
+class UserImportReport(BaseModel):
+    """records_done: every record up to this number is processed, a resumed import skips them"""
+    records: int = 0
+    upserted: int = 0
+    rejected: int = 0
+    records_done: int = 0
+    errors: List[UserImportError] = []
+    error: Optional[str] = None
+
+
+class UserListItem(ShowUser):
+    is_active: Optional[bool]
+    role: int
+
+
+class UserListResponse(BaseModel):
+    users: List[UserListItem]
+    next_cursor: Optional[str]
+
+
 class DeleteUserResponse(BaseModel):
     deleted_user_id: int
 
@@ -69,9 +156,11 @@ class UserDTO(TunedModel):
 
     hashed_password: str
 
+    @property
     def is_superadmin(self) -> bool:
         return self.role == UserRole.ROLE_SUPERADMIN
 
+    @property
     def is_admin(self) -> bool:
         return self.role == UserRole.ROLE_ADMIN
 
@@ -80,3 +169,5 @@ class UserRole(int, Enum):
     ROLE_SUPERADMIN = 0
     ROLE_ADMIN = 1
     ROLE_USER = 2
+    # Service accounts of gateways calling /auth/introspect
+    ROLE_INTROSPECTION_CLIENT = 3
@@ -1,22 +1,35 @@
-from typing import Optional
+import asyncio
+import base64
+import binascii
+import json
+from typing import List, Optional
 
 from fastapi import HTTPException
 
-from auth import Hasher
+from auth import async_hasher
+import settings
+from auth.permissions import Permission
+from auth.permissions import permissions_for_role
+from auth.schemas import UserPrincipal
+from exceptions import handle_bad_request_error
 
 from .dals import SQLAlchemyUserDAL as UserDAL
 from .schemas import UserRole, UserDTO
+from .schemas import BulkUserCreateResponse
+from .schemas import BulkUserCreateResult
 from .schemas import ShowUser
+from .schemas import UserListResponse
 from .schemas import UserCreate
 
 
 async def _create_new_user(body: UserCreate, session) -> ShowUser:
+    hashed_password = await async_hasher.get_password_hash(body.password)
     async with session.begin():
         user_dal = UserDAL(session)
         user = await user_dal.create_user(
             username=body.username,
             email=body.email,
-            hashed_password=Hasher.get_password_hash(body.password),
+            hashed_password=hashed_password,
             role=UserRole.ROLE_USER,
         )
         return ShowUser(
@@ -27,6 +40,49 @@ async def _create_new_user(body: UserCreate, session) -> ShowUser:
         )
 
 
+async def _create_new_users(bodies: List[UserCreate], session) -> BulkUserCreateResponse:
+    """
+    Create many users at once: passwords are hashed in parallel on the bulk share of the hasher pool,
+    rows are inserted in chunks and conflicting items are reported instead of failing the batch.
+    Items repeating an email or username of an earlier item are conflicts and never hashed.
+    """
+    results = [BulkUserCreateResult(index=index, status="conflict") for index in range(len(bodies))]
+    index_by_email = {}
+    seen_usernames = set()
+    unique_bodies = []
+    for index, body in enumerate(bodies):
+        if body.email in index_by_email or body.username in seen_usernames:
+            continue
+        index_by_email[body.email] = index
+        seen_usernames.add(body.username)
+        unique_bodies.append(body)
+    hashed_passwords = await asyncio.gather(
+        *(async_hasher.get_password_hash_bulk(body.password) for body in unique_bodies)
+    )
+    rows = [
+        {
+            "username": body.username,
+            "email": body.email,
+            "hashed_password": hashed_password,
+            "role": UserRole.ROLE_USER,
+        }
+        for body, hashed_password in zip(unique_bodies, hashed_passwords)
+    ]
+
+    created = 0
+    chunk_size = settings.USER_BULK_CREATE_CHUNK_SIZE
+    for start in range(0, len(rows), chunk_size):
+        async with session.begin():
+            user_dal = UserDAL(session)
+            users = await user_dal.create_users(rows[start:start + chunk_size])
+        for user in users:
+            result = results[index_by_email[user.email]]
+            result.status = "created"
+            result.user = ShowUser.model_validate(user)
+        created += len(users)
+    return BulkUserCreateResponse(created=created, conflicts=len(bodies) - created, results=results)
+
+
 async def _delete_user(user_id, session) -> Optional[int]:
     async with session.begin():
         user_dal = UserDAL(session)
@@ -57,15 +113,56 @@ async def _get_user_by_id(user_id, session) -> Optional[UserDTO]:
             return user
 
 
-def has_permissions_to_effect_the_target(target_user: UserDTO, acting_user: UserDTO) -> bool:
+async def _get_users_by(field: str, values: List, session) -> List[UserDTO]:
+    async with session.begin():
+        user_dal = UserDAL(session)
+        get_users = {
+            "user_id": user_dal.get_users_by_ids,
+            "email": user_dal.get_users_by_emails,
+            "username": user_dal.get_users_by_usernames,
+        }[field]
+        return await get_users(values)
+
+
+def _encode_list_cursor(after_user_id: int, filters: dict) -> str:
+    payload = json.dumps({"after": after_user_id, "filters": filters}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_list_cursor(cursor: str, filters: dict) -> int:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        after_user_id = int(payload["after"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        handle_bad_request_error("Invalid cursor.")
+    if payload.get("filters") != filters:
+        handle_bad_request_error("Cursor was issued for different filters.")
+    return after_user_id
+
+
+async def _list_users(
+        limit: int, cursor: Optional[str], role: Optional[int], is_active: Optional[bool], session
+) -> UserListResponse:
+    filters = {"role": role, "is_active": is_active}
+    after_user_id = _decode_list_cursor(cursor, filters) if cursor else None
+    async with session.begin():
+        user_dal = UserDAL(session)
+        users = await user_dal.list_users(
+            limit=limit + 1, after_user_id=after_user_id, role=role, is_active=is_active,
+        )
+    next_cursor = _encode_list_cursor(users[limit - 1].user_id, filters) if len(users) > limit else None
+    return UserListResponse(users=users[:limit], next_cursor=next_cursor)
+
+
+def has_permissions_to_effect_the_target(target_user: UserDTO, acting_user: UserPrincipal) -> bool:
+    """Bit tests on the acting user's token permissions, acting on an admin also needs MANAGE_ADMINS"""
     if target_user.role == UserRole.ROLE_SUPERADMIN:
         raise HTTPException(
             status_code=406, detail="Superadmin cannot be deleted via API."
         )
     if target_user.user_id == acting_user.user_id:
         return False
-    if not acting_user.is_superadmin or not acting_user.is_admin:
-        return False
-    if target_user.is_admin and acting_user.is_admin:
-        return False
-    return True
+    required = Permission.UPDATE_USERS | Permission.DELETE_USERS
+    if permissions_for_role(target_user.role):
+        required |= Permission.MANAGE_ADMINS
+    return acting_user.has(required)
@@ -3,6 +3,8 @@
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from auth.permissions import Permission
+from auth.schemas import UserPrincipal
 from user.schemas import UserDTO
 from user.services import _get_user_by_id, has_permissions_to_effect_the_target
 
@@ -14,13 +16,13 @@ async def validate_user_exists(user_id: int, db: AsyncSession):
     return user
 
 
-def validate_permissions(target_user: UserDTO, acting_user: UserDTO):
+def validate_permissions(target_user: UserDTO, acting_user: UserPrincipal):
     if not has_permissions_to_effect_the_target(target_user=target_user, acting_user=acting_user):
         raise HTTPException(status_code=403, detail="Forbidden.")
 
 
-def validate_superadmin(user: UserDTO):
-    if not user.is_superadmin:
+def validate_superadmin(user: UserPrincipal):
+    if not user.has(Permission.MANAGE_ADMINS):
         raise HTTPException(status_code=403, detail="Forbidden.")
 
 
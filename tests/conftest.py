@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "benchmarks")]
+
+from bench_database import use_bench_database  # noqa: E402
+
+# Before anything imports `session`: tests never touch the service's database
+use_bench_database("auth_service_tests.sqlite")
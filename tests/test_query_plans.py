@@ -0,0 +1,44 @@
+"""
+Every statement of the DAL calls in benchmarks/query_plans.py must be served by an index.
+Seeds a temporary SQLite file, or the throwaway database in BENCH_DATABASE_URL.
+"""
+import asyncio
+import os
+
+import pytest
+import pytest_asyncio
+
+import query_plans
+
+SEEDED_USERS = 2000
+
+
+async def _seed():
+    await query_plans.seed(SEEDED_USERS)
+    await query_plans.engine.dispose()
+
+
+@pytest.fixture(scope="module", autouse=True)
+def seeded_database():
+    asyncio.run(_seed())
+    yield
+    if query_plans.DB_PATH is not None and os.path.exists(query_plans.DB_PATH):
+        os.remove(query_plans.DB_PATH)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def dispose_engine():
+    """Pooled connections belong to the event loop of the test that opened them"""
+    yield
+    await query_plans.engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", list(query_plans.CHECKS))
+async def test_dal_call_uses_indexes(name):
+    statements = await query_plans.capture_statements(query_plans.CHECKS[name])
+    assert statements
+    for statement, parameters in statements:
+        plan = await query_plans.explain(statement, parameters)
+        full_scans = [line for line in plan if query_plans.is_full_scan(line)]
+        assert not full_scans, f"{' '.join(statement.split())} -> {plan}"
@@ -0,0 +1,38 @@
+import session
+from session import USE_PRIMARY
+from session import async_session
+from user.cache import UserCache
+from user.dals import SQLAlchemyUserDAL
+from user.schemas import UserDTO
+
+USER = UserDTO(
+    user_id=1, username="user1", email="user1@example.com", is_active=True, hashed_password="x" * 60, role=2,
+)
+
+
+def test_row_read_before_a_write_is_not_cached():
+    cache = UserCache(maxsize=10, ttl=60)
+    read_epoch = cache.epoch
+    cache.invalidate(user_id=USER.user_id, email=USER.email, username=USER.username)
+    cache.set(USER, read_epoch)
+    assert cache.get("user_id", USER.user_id) is None
+    cache.set(USER, cache.epoch)
+    assert cache.get("email", USER.email) == USER
+
+
+def test_replica_reads_are_not_cached(monkeypatch):
+    monkeypatch.setattr(session, "replica_selector", object())
+    cache = UserCache(maxsize=10, ttl=60)
+    db_session = async_session()
+    SQLAlchemyUserDAL(db_session, cache=cache)._cache_users([USER], cache.epoch)
+    assert cache.get("user_id", USER.user_id) is None
+
+    db_session.info[USE_PRIMARY] = True
+    SQLAlchemyUserDAL(db_session, cache=cache)._cache_users([USER], cache.epoch)
+    assert cache.get("user_id", USER.user_id) == USER
+
+
+def test_reads_are_cached_without_replicas():
+    cache = UserCache(maxsize=10, ttl=60)
+    SQLAlchemyUserDAL(async_session(), cache=cache)._cache_users([USER], cache.epoch)
+    assert cache.get("username", USER.username) == USER